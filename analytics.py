@@ -0,0 +1,212 @@
+# term-wide reports over a columnar copy of the exam schedule, needs NumPy
+
+import argparse
+import csv
+import os
+import sys
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from pool import get_pool
+
+# version of the layout written by ColumnarSchedule.save
+FORMAT = 1
+
+# minutes a room can be booked on an exam day, from 9:00 to 22:00
+EXAM_DAY_MINUTES = 13 * 60
+
+# the columns of ExamSchedule a ColumnarSchedule is read from
+SCHEDULE = '''SELECT Course, Sections, Room, Begins, Ends ''' \
+    '''FROM ExamSchedule'''
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def encode(values):
+    '''Return (dictionary, codes) for the list of strings values: the
+    sorted distinct strings and the int32 index of each value in it.
+    None and empty strings get the code -1.'''
+
+    strings = np.array(
+        [u'' if value is None else value for value in values], dtype=unicode)
+    dictionary, codes = np.unique(strings, return_inverse=True)
+    codes = codes.astype(np.int32)
+    # the empty string sorts first
+    if len(dictionary) and dictionary[0] == u'':
+        dictionary = dictionary[1:]
+        codes -= 1
+    return dictionary, codes
+
+
+def distinct_rows(*columns):
+    '''Return the distinct rows of the equal length integer arrays
+    columns, as one array per column, sorted by the first column, then
+    the second and so on.'''
+
+    order = np.lexsort(columns[::-1])
+    columns = [column[order] for column in columns]
+    # a row is new if any of its values differs from the row before
+    new = np.zeros(len(order), dtype=bool)
+    new[:1] = True
+    for column in columns:
+        new[1:] |= column[1:] != column[:-1]
+    return [column[new] for column in columns]
+
+
+def minutes_text(minutes):
+    '''Return minutes since 1970-01-01 as YYYY-MM-DD HH:MM.'''
+
+    moment = EPOCH + timedelta(minutes=int(minutes))
+    return moment.strftime('%Y-%m-%d %H:%M')
+
+
+def day_text(day):
+    '''Return days since 1970-01-01 as YYYY-MM-DD.'''
+
+    return (EPOCH + timedelta(days=int(day))).strftime('%Y-%m-%d')
+
+
+class ColumnarSchedule(object):
+    '''The sections of the ExamSchedule table as NumPy columns. course,
+    section, room and dept are int32 codes into the sorted string arrays
+    courses, sections, rooms and depts, -1 for a missing room; begins and
+    ends are int64 minutes since 1970-01-01, -1 where the exam time is
+    unknown.'''
+
+    ARRAYS = (
+        'course', 'courses', 'section', 'sections', 'room', 'rooms',
+        'dept', 'depts', 'begins', 'ends')
+
+    def __init__(self, **arrays):
+        for name in self.ARRAYS:
+            setattr(self, name, arrays[name])
+
+    @classmethod
+    def from_db(cls, db):
+        '''Read the ExamSchedule table of db in one pass.'''
+
+        courses, sections, rooms, begins, ends = [], [], [], [], []
+        with get_pool(db).connection() as conn:
+            for row in conn.execute(SCHEDULE):
+                courses.append(row[0])
+                sections.append(row[1])
+                rooms.append(row[2])
+                begins.append(-1 if row[3] is None else row[3])
+                ends.append(-1 if row[4] is None else row[4])
+
+        arrays = {}
+        arrays['courses'], arrays['course'] = encode(courses)
+        arrays['sections'], arrays['section'] = encode(sections)
+        arrays['rooms'], arrays['room'] = encode(rooms)
+        # the department of each distinct course, then of each section
+        arrays['depts'], dept_of_course = encode(
+            [course[:3] for course in arrays['courses']])
+        arrays['dept'] = dept_of_course[arrays['course']]
+        arrays['begins'] = np.array(begins, dtype=np.int64)
+        arrays['ends'] = np.array(ends, dtype=np.int64)
+        return cls(**arrays)
+
+    def save(self, path):
+        '''Write the columns to path as a compressed .npz file.'''
+
+        with open(path, 'wb') as out:
+            np.savez_compressed(out, format=np.array(FORMAT), **dict(
+                (name, getattr(self, name)) for name in self.ARRAYS))
+
+    @classmethod
+    def load(cls, path):
+        '''Read columns written by save.'''
+
+        data = np.load(path, allow_pickle=False)
+        try:
+            if int(data['format']) != FORMAT:
+                raise ValueError(
+                    "%s has format %d, not %d" % (
+                        path, int(data['format']), FORMAT))
+            return cls(**dict((name, data[name]) for name in cls.ARRAYS))
+        finally:
+            data.close()
+
+    def __len__(self):
+        return len(self.course)
+
+    def exams_per_slot(self):
+        '''Return (slots, sections, courses): the sorted start times with
+        an exam, and the number of sections and of distinct courses
+        writing at each.'''
+
+        known = self.begins >= 0
+        slots, slot = np.unique(self.begins[known], return_inverse=True)
+        sections = np.bincount(slot, minlength=len(slots))
+        # each (slot, course) pair once
+        slot, course = distinct_rows(slot, self.course[known])
+        courses = np.bincount(slot, minlength=len(slots))
+        return slots, sections, courses
+
+    def room_utilization(self):
+        '''Return (rooms, sittings, minutes, utilization) per room: the
+        number of distinct exam sittings in it, sections writing together
+        counting once, the minutes it is booked, and the share of
+        EXAM_DAY_MINUTES of every day with an exam that this is.'''
+
+        known = (self.begins >= 0) & (self.room >= 0)
+        room, begins, ends = distinct_rows(
+            self.room[known], self.begins[known], self.ends[known])
+        count = np.bincount(room, minlength=len(self.rooms))
+        minutes = np.bincount(
+            room, weights=ends - begins,
+            minlength=len(self.rooms)).astype(np.int64)
+        days = len(np.unique(self.begins[self.begins >= 0] // 1440))
+        utilization = minutes / float(max(days, 1) * EXAM_DAY_MINUTES)
+        return self.rooms, count, minutes, utilization
+
+    def dept_load_by_day(self):
+        '''Return (days, load): the sorted days with an exam, and the
+        len(depts) x len(days) array of the number of sections of each
+        department writing on each day.'''
+
+        known = self.begins >= 0
+        days, day = np.unique(self.begins[known] // 1440, return_inverse=True)
+        cells = self.dept[known].astype(np.int64) * len(days) + day
+        load = np.bincount(cells, minlength=len(self.depts) * len(days))
+        return days, load.reshape(len(self.depts), len(days))
+
+
+def write_report(schedule, report, out):
+    '''Write report, one of slots, rooms or depts, as CSV to out.'''
+
+    writer = csv.writer(out)
+    if report == 'slots':
+        writer.writerow(["Start", "Sections", "Courses"])
+        for row in zip(*schedule.exams_per_slot()):
+            writer.writerow([minutes_text(row[0]), row[1], row[2]])
+    elif report == 'rooms':
+        writer.writerow(["Room", "Sittings", "Minutes", "Utilization"])
+        for row in zip(*schedule.room_utilization()):
+            writer.writerow([
+                row[0].encode('utf-8'), row[1], row[2], '%.4f' % row[3]])
+    else:
+        days, load = schedule.dept_load_by_day()
+        writer.writerow(["Department"] + [day_text(day) for day in days])
+        for dept, counts in zip(schedule.depts, load):
+            writer.writerow([dept.encode('utf-8')] + list(counts))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Term-wide exam reports as CSV")
+    parser.add_argument("report", choices=("slots", "rooms", "depts"))
+    parser.add_argument("--db", default="exams.db")
+    parser.add_argument(
+        "--snapshot", help="read the columns from this file, saving them "
+        "there from the database first if it does not exist")
+    options = parser.parse_args()
+
+    if options.snapshot and os.path.exists(options.snapshot):
+        schedule = ColumnarSchedule.load(options.snapshot)
+    else:
+        schedule = ColumnarSchedule.from_db(options.db)
+        if options.snapshot:
+            schedule.save(options.snapshot)
+    write_report(schedule, options.report, sys.stdout)
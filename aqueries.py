@@ -0,0 +1,108 @@
+# asyncio versions of the exam lookups in queries.py; on Python 2 they
+# need the trollius and futures backports
+
+try:
+    import asyncio
+except ImportError:
+    # the Python 2 backport of asyncio
+    try:
+        import trollius as asyncio
+    except ImportError:
+        raise ImportError(
+            'aqueries needs asyncio: on Python 2 install the trollius '
+            'backport (pip install trollius)')
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    raise ImportError(
+        'aqueries needs concurrent.futures: on Python 2 install the '
+        'futures backport (pip install futures)')
+import threading
+
+import pool
+import queries
+
+# threads running SQLite work; each borrows a pooled connection, so there
+# is no point in having more threads than connections
+MAX_WORKERS = pool.POOL_SIZE
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    '''Return the shared executor the lookups run on, creating it with
+    MAX_WORKERS threads if needed.'''
+
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(MAX_WORKERS)
+    return _executor
+
+
+def shutdown(wait=True):
+    '''Stop the executor and close the pooled connections.'''
+
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait)
+            _executor = None
+    pool.close_all()
+
+
+def submit(func, *args, **kwargs):
+    '''Return an awaitable for func(*args) run on the executor. With a
+    timeout keyword, it raises asyncio.TimeoutError after that many
+    seconds. Cancelling it before a thread picks it up stops it from
+    running; a lookup already running finishes in the background and its
+    result is dropped.'''
+
+    timeout = kwargs.pop('timeout', None)
+    loop = asyncio.get_event_loop()
+    future = loop.run_in_executor(get_executor(), func, *args)
+    if timeout is not None:
+        return asyncio.wait_for(future, timeout)
+    return future
+
+
+def run_query(db, q, args=None, timeout=None):
+    '''Awaitable version of queries.run_query.'''
+
+    return submit(queries.run_query, db, q, args, timeout=timeout)
+
+
+def get_course_time(db, course, timeout=None):
+    '''Awaitable version of queries.get_course_time.'''
+
+    return submit(queries.get_course_time, db, course, timeout=timeout)
+
+
+def get_course_time_section(db, course, section, timeout=None):
+    '''Awaitable version of queries.get_course_time_section.'''
+
+    return submit(
+        queries.get_course_time_section, db, course, section,
+        timeout=timeout)
+
+
+def get_locations(db, course, timeout=None):
+    '''Awaitable version of queries.get_locations.'''
+
+    return submit(queries.get_locations, db, course, timeout=timeout)
+
+
+def check_conflicts(db, course, timeout=None):
+    '''Awaitable version of queries.check_conflicts.'''
+
+    return submit(queries.check_conflicts, db, course, timeout=timeout)
+
+
+def gather_course_times(db, courses, timeout=None):
+    '''Awaitable for the list of get_course_time results of every course
+    in courses, looked up concurrently.'''
+
+    return asyncio.gather(*[
+        get_course_time(db, course, timeout=timeout) for course in courses])
@@ -0,0 +1,406 @@
+# timing of the exam lookups
+
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+import timeit
+import traceback
+
+import make_tables
+import pool
+import queries
+import synthetic
+
+from queries import COURSE_TIME
+
+# the get_course_time statement with the course formatted into the SQL
+# text, as the statements were written before they took parameters
+COURSE_TIME_FORMAT = COURSE_TIME.replace('?', "'%s'")
+
+
+def run_query_unpooled(db, q, args=None):
+    '''The old run_query, opening and closing a connection on every call.'''
+
+    conn = sqlite3.connect(db)
+    cur = conn.cursor()
+    if args is None:
+        cur.execute(q)
+    else:
+        cur.execute(q, args)
+    results = cur.fetchall()
+    cur.close()
+    conn.close()
+    return results
+
+
+def time_calls(func, n):
+    '''Return the mean seconds per call of n back-to-back calls to func.'''
+
+    start = timeit.default_timer()
+    for _ in xrange(n):
+        func()
+    return (timeit.default_timer() - start) / n
+
+
+def bench_pool(db, course, n=10000):
+    '''Return the per-call latency of the get_course_time statement
+    without and with the connection pool.'''
+
+    before = time_calls(
+        lambda: run_query_unpooled(db, COURSE_TIME, (course,)), n)
+    after = time_calls(
+        lambda: queries.run_query(db, COURSE_TIME, (course,)), n)
+    return before, after
+
+
+def all_courses(db):
+    '''Return the list of distinct course codes in db.'''
+
+    return [row[0] for row in queries.run_query(
+        db, '''SELECT DISTINCT Course FROM Courses''')]
+
+
+def bench_statements(db, n=10000):
+    '''Return the per-call latency of get_course_time over n lookups of
+    different courses, with the course formatted into the SQL text and
+    with the cached parameterized statement.'''
+
+    courses = all_courses(db)
+    lookups = [courses[i % len(courses)] for i in xrange(n)]
+    lookups = iter(lookups * 2)
+
+    before = time_calls(
+        lambda: queries.run_query(db, COURSE_TIME_FORMAT % next(lookups)), n)
+    after = time_calls(
+        lambda: queries.get_course_time(db, next(lookups)), n)
+    return before, after
+
+
+# find_dept_courses as a LIKE over every course, before the prefix range
+DEPT_SCAN = '''SELECT Course FROM Courses WHERE Course LIKE ?'''
+
+
+def bench_dept(db, dept, n=100):
+    '''Return the per-call latency of listing the courses of dept with a
+    full LIKE scan and with the indexed prefix range. Meant for a catalog
+    of about 1M rows.'''
+
+    before = time_calls(
+        lambda: queries.run_query(db, DEPT_SCAN, (dept + "%",)), n)
+    after = time_calls(lambda: queries.find_dept_courses(db, dept), n)
+    return before, after
+
+
+def bench_async(db, course, concurrency, n=10000):
+    '''Return the lookups per second of n get_course_time calls made one
+    after another through queries and concurrency at a time through
+    aqueries.'''
+
+    # needs asyncio, or trollius on Python 2
+    import aqueries
+    asyncio = aqueries.asyncio
+
+    start = timeit.default_timer()
+    for _ in xrange(n):
+        queries.get_course_time(db, course)
+    blocking = n / (timeit.default_timer() - start)
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    start = timeit.default_timer()
+    for _ in xrange(n // concurrency):
+        loop.run_until_complete(
+            aqueries.gather_course_times(db, [course] * concurrency))
+    concurrent = (n // concurrency * concurrency) / (
+        timeit.default_timer() - start)
+    loop.close()
+    return blocking, concurrent
+
+
+def report(name, before, after):
+    print "%s: %.1f us -> %.1f us per call (%.1fx)" % (
+        name, before * 1e6, after * 1e6, before / after)
+
+
+# per-call timings are kept for this many calls of each lookup
+CALLS = 1000
+
+# the whole-table reports are slow on large catalogs, fewer calls of them
+REPORT_CALLS = 5
+
+# number of courses handed to each call of a batch lookup
+BATCH_KEYS = 100
+
+# the create_*_table functions in the order they are run, with the csv
+# file each one loads, then the tables built from them
+LOADERS = (
+    ('create_course_table', make_tables.create_course_table, 'Courses'),
+    ('create_location_table', make_tables.create_location_table,
+     'Locations'),
+    ('create_time_table', make_tables.create_time_table, 'Time'),
+    ('build_derived_tables', make_tables.build_derived_tables, None),
+    )
+
+
+def in_child(func, *args):
+    '''Run func(*args) in a forked process and return (result, seconds,
+    peak_kib), peak_kib being how far the child's peak resident memory
+    grew above what it started with. The result must be JSON
+    serializable. Each measurement gets a fresh process because the peak
+    of a process never goes down.'''
+
+    read_end, write_end = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_end)
+        status = 0
+        try:
+            base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            start = timeit.default_timer()
+            result = func(*args)
+            seconds = timeit.default_timer() - start
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            # ru_maxrss is in KiB on Linux but in bytes on macOS
+            if sys.platform == 'darwin':
+                peak, base = peak // 1024, base // 1024
+            message = json.dumps({
+                "result": result, "seconds": seconds,
+                "peak_kib": peak - base})
+        except BaseException:
+            message = json.dumps({"error": traceback.format_exc()})
+            status = 1
+        with os.fdopen(write_end, 'wb') as pipe:
+            pipe.write(message)
+        os._exit(status)
+
+    os.close(write_end)
+    with os.fdopen(read_end, 'rb') as pipe:
+        message = json.loads(pipe.read() or '{"error": "no result"}')
+    os.waitpid(pid, 0)
+    if "error" in message:
+        raise RuntimeError(
+            "%s failed in the child:\n%s" % (
+                getattr(func, '__name__', func), message["error"]))
+    return message["result"], message["seconds"], message["peak_kib"]
+
+
+def percentile(samples, p):
+    '''Return the p-th percentile of the sorted list samples, by the
+    nearest rank.'''
+
+    rank = int(round(p / 100.0 * len(samples))) - 1
+    return samples[min(max(rank, 0), len(samples) - 1)]
+
+
+def latencies(func, calls):
+    '''Call func(arg) for every arg in calls and return the sorted list
+    of seconds each call took.'''
+
+    timer = timeit.default_timer
+    samples = []
+    for arg in calls:
+        start = timer()
+        func(*arg)
+        samples.append(timer() - start)
+    samples.sort()
+    return samples
+
+
+def sample_sections(db, n, seed=0):
+    '''Return n (course, section) pairs picked at random from db, by
+    rowid so the catalog is never read whole.'''
+
+    rng = random.Random(seed)
+    last = queries.run_query(db, '''SELECT max(rowid) FROM Courses''')[0][0]
+    rowids = [rng.randint(1, last) for _ in xrange(n)]
+    sections = queries.run_batch_query(
+        db, '''SELECT rowid, Course, Sections FROM Courses '''
+        '''WHERE rowid IN (%s)''', sorted(set(rowids)))
+    return [tuple(sections[rowid][0]) for rowid in rowids]
+
+
+def lookup_calls(db, n=CALLS, seed=0):
+    '''Return the lookups to time as (name, function, list of argument
+    tuples), every function taking db first.'''
+
+    sections = sample_sections(db, n, seed)
+    codes = [course for course, section in sections]
+    courses = [(db, course) for course in codes]
+    with_section = [(db, course, section) for course, section in sections]
+    depts = [(db, course[:3]) for course in codes]
+    batches = [
+        (db, codes[i:i + BATCH_KEYS]) for i in xrange(0, n, BATCH_KEYS)]
+    section_batches = [
+        (db, sections[i:i + BATCH_KEYS]) for i in xrange(0, n, BATCH_KEYS)]
+    reports = [(db,)] * REPORT_CALLS
+
+    return [
+        ('get_course_instructors', queries.get_course_instructors, courses),
+        ('get_course_time', queries.get_course_time, courses),
+        ('get_course_time_section', queries.get_course_time_section,
+         with_section),
+        ('get_locations', queries.get_locations, courses),
+        ('check_conflicts', queries.check_conflicts, courses),
+        ('find_dept_courses', queries.find_dept_courses, depts),
+        ('count_dept_courses', queries.count_dept_courses, depts),
+        ('find_exam', queries.find_exam, with_section),
+        ('get_course_instructors_batch',
+         queries.get_course_instructors_batch, batches),
+        ('get_course_time_batch', queries.get_course_time_batch, batches),
+        ('get_course_time_section_batch',
+         queries.get_course_time_section_batch, section_batches),
+        ('get_locations_batch', queries.get_locations_batch, batches),
+        ('courses_multi_instructors', queries.courses_multi_instructors,
+         reports),
+        ('courses_how_many_instructors',
+         queries.courses_how_many_instructors, reports),
+        ('all_conflicts', queries.all_conflicts, reports),
+        ]
+
+
+def load_table(create, db, path):
+    '''Run create(db, csv file at path) the way make_tables does, the
+    derived tables left to build_derived_tables, or create(db) if path is
+    None.'''
+
+    if path is None:
+        create(db)
+        return
+    with open(path, 'rb') as csv_file:
+        create(db, csv_file, derived=False)
+
+
+def time_lookups(func, calls):
+    '''Return the number of calls, calls per second and p50 and p99
+    latency in microseconds of func over calls, after one untimed call
+    that opens the pooled connection.'''
+
+    func(*calls[0])
+    samples = latencies(func, calls)
+    return {
+        "calls": len(samples),
+        "per_second": len(samples) / sum(samples),
+        "p50_us": percentile(samples, 50) * 1e6,
+        "p99_us": percentile(samples, 99) * 1e6,
+        }
+
+
+def bench_scale(directory, rows, calls=CALLS, seed=0):
+    '''Generate a catalog of rows sections in directory, load it with
+    every create_*_table and time every lookup on it. Return the results
+    as a dict: for each load, the seconds, rows per second and peak
+    memory; for each lookup, the calls per second, p50 and p99 latency
+    and peak memory.'''
+
+    start = timeit.default_timer()
+    paths = synthetic.write_catalog(directory, rows, seed)
+    results = {
+        "rows": rows,
+        "seed": seed,
+        "generate_seconds": timeit.default_timer() - start,
+        "load": {},
+        "queries": {},
+        }
+
+    db = os.path.join(directory, 'exams.db')
+    for name, create, table in LOADERS:
+        result, seconds, peak = in_child(
+            load_table, create, db, paths.get(table))
+        results["load"][name] = {
+            "seconds": seconds, "rows_per_second": rows / seconds,
+            "peak_kib": peak}
+
+    for name, func, args in lookup_calls(db, calls, seed):
+        result, seconds, peak = in_child(time_lookups, func, args)
+        result["peak_kib"] = peak
+        results["queries"][name] = result
+    return results
+
+
+def environment():
+    '''Return the versions a result was measured with, to tell apart
+    regressions from upgrades.'''
+
+    return {
+        "time": time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        }
+
+
+def parse_size(text):
+    '''Return the number of rows in text, such as 1000, 10k or 10M.'''
+
+    scale = {'k': 1000, 'm': 1000000}.get(text[-1:].lower())
+    if scale is None:
+        return int(text)
+    return int(float(text[:-1]) * scale)
+
+
+def report_scale(results):
+    print "%d rows" % results["rows"]
+    for name, _, _ in LOADERS:
+        load = results["load"][name]
+        print "  %-30s %8.2f s %10.0f rows/s %8d KiB" % (
+            name, load["seconds"], load["rows_per_second"],
+            load["peak_kib"])
+    for name in sorted(results["queries"]):
+        query = results["queries"][name]
+        print "  %-30s %10.0f/s p50 %8.1f us p99 %8.1f us %8d KiB" % (
+            name, query["per_second"], query["p50_us"], query["p99_us"],
+            query["peak_kib"])
+
+
+def scale_main(argv):
+    parser = argparse.ArgumentParser(
+        description="Time loading and querying synthetic catalogs")
+    parser.add_argument(
+        "--scale", nargs="+", type=parse_size, required=True,
+        help="catalog sizes in rows, such as 1k 100k 10M")
+    parser.add_argument(
+        "--output", default="benchmark.jsonl",
+        help="file each result is appended to as one JSON line")
+    parser.add_argument("--calls", type=int, default=CALLS)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--dir", help="where to write the catalogs, a temporary "
+        "directory removed afterwards by default")
+    options = parser.parse_args(argv)
+
+    for rows in options.scale:
+        directory = options.dir or tempfile.mkdtemp(prefix='exams-bench-')
+        try:
+            results = bench_scale(
+                directory, rows, options.calls, options.seed)
+        finally:
+            pool.close_all()
+            if not options.dir:
+                shutil.rmtree(directory)
+        results.update(environment())
+        report_scale(results)
+        with open(options.output, 'a') as output:
+            output.write(json.dumps(results, sort_keys=True) + '\n')
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        scale_main(sys.argv[1:])
+        sys.exit()
+
+    db = 'exams.db'
+    course = raw_input("Course to look up: ")
+    report("connection pool", *bench_pool(db, course))
+    report("prepared statements", *bench_statements(db))
+    report("department search", *bench_dept(db, course[:3]))
+    for concurrency in (1, 10, 100):
+        print "asyncio, %d concurrent: %.0f -> %.0f lookups/s" % ((
+            concurrency,) + bench_async(db, course, concurrency))
@@ -0,0 +1,104 @@
+# remember query results until the database changes
+
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+# number of results kept before the least recently used one is dropped
+CACHE_SIZE = 1024
+
+
+class ResultCache(object):
+    '''A size-bounded LRU cache of query results keyed on the database,
+    statement and arguments. Before every lookup it checks whether the
+    database changed, by its file identity, size and mtime and by SQLite's
+    data_version, and forgets that database's results if it did.'''
+
+    def __init__(self, maxsize=None):
+        self.maxsize = CACHE_SIZE if maxsize is None else maxsize
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._results = OrderedDict()
+        self._versions = {}
+        self._watchers = {}
+        self._lock = threading.Lock()
+
+    def _signature(self, db):
+        '''Return the current version of db, reopening the watching
+        connection if the file was replaced.'''
+
+        try:
+            st = os.stat(db)
+        except OSError:
+            return None
+        ident = (st.st_dev, st.st_ino)
+        watcher = self._watchers.get(db)
+        if watcher is None or watcher[0] != ident:
+            if watcher is not None:
+                watcher[1].close()
+            # data_version only changes for commits made by other
+            # connections, so each database gets its own
+            watcher = (ident, sqlite3.connect(db, check_same_thread=False))
+            self._watchers[db] = watcher
+        version = watcher[1].execute('PRAGMA data_version').fetchone()[0]
+        return ident, st.st_size, st.st_mtime, version
+
+    def _validate(self, db):
+        '''Drop the results of db if it changed, return its version.'''
+
+        signature = self._signature(db)
+        versions = self._versions
+        if versions.get(db) != signature:
+            if db in versions:
+                # a file replaced under db is refetched on fresh
+                # connections: the pool drops those to the old file
+                self.invalidations += 1
+                for key in [key for key in self._results if key[0] == db]:
+                    del self._results[key]
+            versions[db] = signature
+        return signature
+
+    def run(self, db, q, args, fetch):
+        '''Return the cached result of q with args on db, or the result of
+        fetch(db, q, args), which is then cached.'''
+
+        key = (db, q, None if args is None else tuple(args))
+        with self._lock:
+            version = self._validate(db)
+            if key in self._results:
+                self.hits += 1
+                # move the result to the most recently used end
+                results = self._results.pop(key)
+                self._results[key] = results
+                return list(results)
+            self.misses += 1
+
+        results = fetch(db, q, args)
+
+        with self._lock:
+            # a result read while the database changed is not kept
+            if version is not None and self._validate(db) == version:
+                self._results[key] = results
+                while len(self._results) > self.maxsize:
+                    self._results.popitem(last=False)
+        return list(results)
+
+    def stats(self):
+        '''Return a dict of the hit, miss and invalidation counts and the
+        number of results held.'''
+
+        return {
+            "hits": self.hits, "misses": self.misses,
+            "invalidations": self.invalidations, "size": len(self._results)}
+
+    def clear(self):
+        '''Forget every result and close the watching connections.'''
+
+        with self._lock:
+            self._results.clear()
+            for ident, conn in self._watchers.values():
+                conn.close()
+            self._watchers.clear()
+            self._versions.clear()
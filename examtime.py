@@ -0,0 +1,111 @@
+# turn the text dates and times of the Time table into numbers
+
+import calendar
+from datetime import datetime
+
+# formats tried, in order, for the Date column
+DATE_FORMATS = (
+    '%d-%b-%y', '%d-%b-%Y', '%Y-%m-%d', '%m/%d/%Y', '%m/%d/%y',
+    '%b %d %Y', '%B %d %Y', '%d %b %Y', '%d %B %Y', '%a %b %d %Y',
+    )
+
+# formats tried, in order, for the Start and End columns
+CLOCK_FORMATS = (
+    '%H:%M', '%I:%M %p', '%I:%M%p', '%H:%M:%S', '%I %p', '%I%p', '%H%M',
+    )
+
+_dates = {}
+_clocks = {}
+
+
+def _parse(text, formats):
+    text = text.strip()
+    for fmt in formats:
+        try:
+            return datetime.strptime(text, fmt)
+        except ValueError:
+            pass
+    return None
+
+
+def parse_date(text):
+    '''Return the date in text as days since 1970-01-01, or None if it is
+    not in any of the DATE_FORMATS.'''
+
+    # a term has only a few distinct dates, so remember each one
+    try:
+        return _dates[text]
+    except KeyError:
+        pass
+    parsed = _parse(text or '', DATE_FORMATS)
+    if parsed is not None:
+        parsed = calendar.timegm(parsed.timetuple()) // 86400
+    _dates[text] = parsed
+    return parsed
+
+
+def parse_clock(text):
+    '''Return the time of day in text as minutes after midnight, or None
+    if it is not in any of the CLOCK_FORMATS.'''
+
+    try:
+        return _clocks[text]
+    except KeyError:
+        pass
+    parsed = _parse(text or '', CLOCK_FORMATS)
+    if parsed is not None:
+        parsed = parsed.hour * 60 + parsed.minute
+    _clocks[text] = parsed
+    return parsed
+
+
+def exam_span(date, start, end, duration):
+    '''Return the (start, end) of an exam as minutes since 1970-01-01,
+    using duration in hours when end is missing. Return None if the date
+    or start time cannot be read.'''
+
+    day = parse_date(date)
+    begin = parse_clock(start)
+    if day is None or begin is None:
+        return None
+    begin += day * 1440
+
+    finish = parse_clock(end)
+    if finish is not None:
+        finish += day * 1440
+        # an exam running past midnight
+        if finish < begin:
+            finish += 1440
+    else:
+        try:
+            finish = begin + int(round(float(duration) * 60))
+        except (TypeError, ValueError):
+            finish = begin
+    return begin, finish
+
+
+def exam_begins(date, start):
+    '''Return the start of an exam as minutes since 1970-01-01, or None
+    if the date or start time cannot be read.'''
+
+    day = parse_date(date)
+    begin = parse_clock(start)
+    if day is None or begin is None:
+        return None
+    return day * 1440 + begin
+
+
+def exam_ends(date, start, end, duration):
+    '''Return the end of an exam as in exam_span, or None.'''
+
+    span = exam_span(date, start, end, duration)
+    return None if span is None else span[1]
+
+
+def to_minutes(when):
+    '''Return a datetime, or a date at midnight, as minutes since
+    1970-01-01, on the same wall clock as the exam times.'''
+
+    if not isinstance(when, datetime):
+        when = datetime(when.year, when.month, when.day)
+    return calendar.timegm(when.timetuple()) // 60
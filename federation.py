@@ -0,0 +1,162 @@
+# run the exam lookups across the databases of several terms at once; on
+# Python 2 this needs the futures backport
+
+import argparse
+import csv
+import sys
+import time
+from collections import OrderedDict
+try:
+    from concurrent.futures import ThreadPoolExecutor, wait
+except ImportError:
+    raise ImportError(
+        'federation needs concurrent.futures: on Python 2 install the '
+        'futures backport (pip install futures)')
+
+import pool
+import queries
+
+
+class ShardTimeout(Exception):
+    """A term's database did not answer within the timeout."""
+
+
+class Federation(object):
+    '''The exam databases of several terms, given as (term, db) pairs or
+    a dict. Every lookup runs on all of them in parallel, each term on its
+    own pooled connections, which stay open between lookups. The rows
+    returned are tagged with their term as their first column.'''
+
+    def __init__(self, terms, max_workers=None):
+        self.terms = OrderedDict(terms)
+        if max_workers is None:
+            # as in aqueries, no point in more threads than connections
+            max_workers = max(len(self.terms), 1) * pool.POOL_SIZE
+        self._executor = ThreadPoolExecutor(max_workers)
+
+    def fan_out(self, func, *args, **kwargs):
+        '''Call func(db, *args) for the database of every term and yield
+        (term, result) in the order the terms answer, so a slow term does
+        not hold back the others. result is the exception if the call
+        raised, or a ShardTimeout for the terms that have not answered
+        timeout seconds after the start.'''
+
+        timeout = kwargs.pop('timeout', None)
+        if timeout is not None:
+            deadline = time.time() + timeout
+        futures = dict(
+            (self._executor.submit(func, db, *args), term)
+            for term, db in self.terms.items())
+        pending = set(futures)
+        while pending:
+            if timeout is not None:
+                timeout = max(deadline - time.time(), 0)
+            done, pending = wait(
+                pending, timeout, return_when='FIRST_COMPLETED')
+            if not done:
+                # the late calls run to the end, their results dropped
+                for future in pending:
+                    future.cancel()
+                    yield futures[future], ShardTimeout(futures[future])
+                return
+            for future in done:
+                error = future.exception()
+                yield futures[future], (
+                    error if error is not None else future.result())
+
+    def gather(self, func, *args, **kwargs):
+        '''Return (rows, errors) for func across all terms: the rows of
+        every term that answered, each as (term,) + row, in the order of
+        the terms, and a dict of term to the exception of those that did
+        not. This waits for the slowest term, or timeout; use fan_out to
+        handle each term as it answers.'''
+
+        results = {}
+        errors = {}
+        for term, result in self.fan_out(func, *args, **kwargs):
+            if isinstance(result, Exception):
+                errors[term] = result
+            else:
+                results[term] = result
+        rows = [
+            (term,) + tuple(row)
+            for term in self.terms if term in results
+            for row in results[term]]
+        return rows, errors
+
+    def get_course_time(self, course, timeout=None):
+        '''Return queries.get_course_time in every term, with gather.'''
+
+        return self.gather(
+            queries.get_course_time, course, timeout=timeout)
+
+    def get_locations(self, course, timeout=None):
+        '''Return queries.get_locations in every term, with gather.'''
+
+        return self.gather(queries.get_locations, course, timeout=timeout)
+
+    def check_conflicts(self, course, timeout=None):
+        '''Return queries.check_conflicts in every term, with gather.'''
+
+        return self.gather(
+            queries.check_conflicts, course, timeout=timeout)
+
+    def find_dept_courses(self, dept, timeout=None):
+        '''Return queries.find_dept_courses in every term, with gather.'''
+
+        return self.gather(
+            queries.find_dept_courses, dept, timeout=timeout)
+
+    def close(self):
+        '''Stop the threads; the pooled connections are closed at exit.'''
+
+        self._executor.shutdown(wait=False)
+
+
+# lookup name on the command line -> (query, csv header)
+LOOKUPS = {
+    'time': (queries.get_course_time, ["Term", "Course", "Date", "Start"]),
+    'locations': (
+        queries.get_locations, ["Term", "Course", "Sections", "Room"]),
+    'conflicts': (queries.check_conflicts, ["Term", "Course"]),
+    'dept': (queries.find_dept_courses, ["Term", "Course"]),
+    }
+
+
+def term_db(text):
+    '''Parse a TERM=DB command line argument.'''
+
+    term, sep, db = text.partition('=')
+    if not sep or not term or not db:
+        raise argparse.ArgumentTypeError("expected TERM=DB, got %r" % text)
+    return term, db
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Look up a course in the exams of several terms")
+    parser.add_argument("lookup", choices=sorted(LOOKUPS))
+    parser.add_argument("key", help="course code, or department for dept")
+    parser.add_argument(
+        "--term", type=term_db, action="append", required=True,
+        metavar="TERM=DB", help="a term and its database, repeatable")
+    parser.add_argument(
+        "--timeout", type=float, help="seconds to wait for the slowest term")
+    options = parser.parse_args()
+
+    federation = Federation(options.term)
+    query, header = LOOKUPS[options.lookup]
+    writer = csv.writer(sys.stdout)
+    writer.writerow(header)
+    # write each term's rows as soon as it answers, so a slow term does
+    # not hold back the others
+    for term, result in federation.fan_out(
+            query, options.key, timeout=options.timeout):
+        if isinstance(result, Exception):
+            sys.stderr.write("%s: %r\n" % (term, result))
+            continue
+        for row in result:
+            writer.writerow(
+                [value.encode('utf-8') for value in (term,) + tuple(row)])
+        sys.stdout.flush()
+    federation.close()
@@ -0,0 +1,346 @@
+# a read-only binary copy of the exam lookups, searched through mmap
+
+import mmap
+import os
+import struct
+import sys
+
+MAGIC = b'EXAMLKUP'
+
+# bumped whenever the layout below changes
+VERSION = 1
+
+# the file is the header, the fences, the records and the string pool;
+# the header holds the magic, version, record count, key width, record
+# size, records per block, records and string pool offsets, and the size
+# and mtime in nanoseconds of the database the file was built from
+HEADER = struct.Struct('<8sIIIIIQQQQ')
+
+# the records are cut in blocks of about this many bytes and the key of
+# the first record of each block is repeated in the fences, which follow
+# the header and are few enough to be read in with it: a cold lookup
+# searches them, then a single block, instead of faulting in a page at
+# every step of a binary search over all the records
+BLOCK_BYTES = 4096
+
+# each record is its key, NUL padded to the key width, then for each of
+# FIELDS the offset in the string pool and length of its value, the
+# length being NULL_LENGTH for a NULL
+FIELDS = ('ID', 'Date', 'Start', 'Room', 'Instructors')
+RECORD_REFS = struct.Struct('<' + 'IH' * len(FIELDS))
+NULL_LENGTH = 0xFFFF
+
+# every section of ExamSchedule, in the order of the record keys: text
+# sorts by its UTF-8 bytes, so Course then Sections is the order of
+# course + NUL + section
+SCHEDULE = '''SELECT Course, Sections, ID, Date, Start, Room, ''' \
+    '''Instructors FROM ExamSchedule ORDER BY Course, Sections, ID'''
+
+KEY_WIDTH = '''SELECT max(length(CAST(Course AS BLOB)) + ''' \
+    '''length(CAST(coalesce(Sections, '') AS BLOB))) + 1, count(*) ''' \
+    '''FROM ExamSchedule'''
+
+
+def lookup_path(db):
+    '''Return the path of the lookup file kept next to database db.'''
+
+    return os.path.splitext(db)[0] + '.lookup'
+
+
+def to_bytes(text):
+    if isinstance(text, bytes):
+        return text
+    return text.encode('utf-8')
+
+
+def record_key(course, section):
+    '''Return the key records are sorted on, course and section as UTF-8
+    separated by a NUL byte.'''
+
+    return to_bytes(course) + b'\0' + to_bytes(section or u'')
+
+
+def db_stamp(db):
+    '''Return the (size, mtime in nanoseconds) of database db.'''
+
+    st = os.stat(db)
+    return st.st_size, int(st.st_mtime * 1e9)
+
+
+def current_umask():
+    '''Return the umask of the process, which can only be read by
+    setting it.'''
+
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
+
+
+def write_lookup_file(db, path=None):
+    '''Write the lookup file of database db from its ExamSchedule table,
+    to lookup_path(db) by default. The file is written under a temporary
+    name and renamed over the old one, so a reader sees either the old
+    or the new file, never a partial one. Return the number of records.'''
+
+    # only the writer needs these, a one-off lookup does not pay for
+    # importing them
+    import sqlite3
+    import tempfile
+
+    path = path or lookup_path(db)
+    con = sqlite3.connect(db)
+    try:
+        key_width, count = con.execute(KEY_WIDTH).fetchone()
+        key_width = key_width or 1
+        record_size = key_width + RECORD_REFS.size
+        block = max(BLOCK_BYTES // record_size, 1)
+        fence_count = (count + block - 1) // block
+        record_offset = HEADER.size + fence_count * key_width
+
+        fd, temp = tempfile.mkstemp(
+            prefix=os.path.basename(path) + '.',
+            dir=os.path.dirname(path) or '.')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                # the header and fences are written last
+                out.write(b'\0' * record_offset)
+                # strings repeat a lot (dates, times, rooms), keep each once
+                pool = {}
+                pool_size = [0]
+                chunks = []
+                fences = []
+
+                def ref(value):
+                    if value is None:
+                        return 0, NULL_LENGTH
+                    data = to_bytes(value)
+                    if data not in pool:
+                        if len(data) >= NULL_LENGTH:
+                            raise ValueError("string too long: %r" % value)
+                        pool[data] = pool_size[0]
+                        pool_size[0] += len(data)
+                        chunks.append(data)
+                    return pool[data], len(data)
+
+                written = 0
+                previous = b''
+                for row in con.execute(SCHEDULE):
+                    key = record_key(row[0], row[1])
+                    if key < previous:
+                        raise ValueError("ExamSchedule is not in key order")
+                    previous = key
+                    refs = []
+                    for value in row[2:]:
+                        refs.extend(ref(value))
+                    key = key.ljust(key_width, b'\0')
+                    if written % block == 0:
+                        fences.append(key)
+                    out.write(key)
+                    out.write(RECORD_REFS.pack(*refs))
+                    written += 1
+                con.close()
+                if written != count:
+                    raise ValueError("ExamSchedule changed while writing")
+
+                pool_offset = record_offset + count * record_size
+                out.write(b''.join(chunks))
+                out.seek(0)
+                out.write(HEADER.pack(
+                    MAGIC, VERSION, count, key_width, record_size, block,
+                    record_offset, pool_offset, *db_stamp(db)))
+                out.write(b''.join(fences))
+                out.flush()
+                os.fsync(out.fileno())
+            # mkstemp creates the file readable by its owner only, give it
+            # the mode open() would
+            os.chmod(temp, 0o666 & ~current_umask())
+            if os.name == 'nt' and os.path.exists(path):
+                # rename does not replace an existing file on Windows
+                os.remove(path)
+            os.rename(temp, path)
+        except BaseException:
+            if os.path.exists(temp):
+                os.remove(temp)
+            raise
+    finally:
+        con.close()
+    return count
+
+
+class LookupFile(object):
+    '''A lookup file mapped into memory. Nothing is read up front: each
+    lookup binary searches the fences, then the block of sorted keys they
+    point to, so a cold lookup touches only a few pages.'''
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            st = os.fstat(f.fileno())
+            self.identity = (st.st_dev, st.st_ino, st.st_size, st.st_mtime)
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._map) < HEADER.size:
+            raise ValueError("%s is not a lookup file" % path)
+        (magic, version, self.count, self.key_width, self.record_size,
+         self.block, self.record_offset, self.pool_offset, db_size,
+         db_mtime) = HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            raise ValueError("%s is not a lookup file" % path)
+        if version != VERSION:
+            raise ValueError(
+                "%s has version %d, not %d, rebuild it with "
+                "make_tables.py" % (path, version, VERSION))
+        self.db_stamp = (db_size, db_mtime)
+        self.fences = (self.record_offset - HEADER.size) // (
+            self.key_width or 1)
+
+    def _key(self, i):
+        start = self.record_offset + i * self.record_size
+        return self._map[start:start + self.key_width]
+
+    def _fence(self, i):
+        start = HEADER.size + i * self.key_width
+        return self._map[start:start + self.key_width]
+
+    def _lower_bound(self, key):
+        '''Return the index of the first record whose key is not less
+        than key, padded to the key width.'''
+
+        key = key.ljust(self.key_width, b'\0')
+        # the number of blocks starting with a key less than key: the
+        # record sought is in the last of them, or starts the next one
+        low, high = 0, self.fences
+        while low < high:
+            middle = (low + high) // 2
+            if self._fence(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        high = min(low * self.block, self.count)
+        low = max(low - 1, 0) * self.block
+        while low < high:
+            middle = (low + high) // 2
+            if self._key(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _string(self, offset, length):
+        if length == NULL_LENGTH:
+            return None
+        start = self.pool_offset + offset
+        return self._map[start:start + length].decode('utf-8')
+
+    def _record(self, i):
+        '''Return record i as (course, section, ID, date, start, room,
+        instructors).'''
+
+        start = self.record_offset + i * self.record_size
+        key = self._map[start:start + self.key_width].rstrip(b'\0')
+        course, _, section = key.partition(b'\0')
+        refs = RECORD_REFS.unpack_from(self._map, start + self.key_width)
+        return (course.decode('utf-8'), section.decode('utf-8')) + tuple(
+            self._string(refs[j], refs[j + 1])
+            for j in range(0, len(refs), 2))
+
+    def _records(self, prefix, exact):
+        if len(prefix) > self.key_width:
+            return []
+        records = []
+        i = self._lower_bound(prefix)
+        padded = prefix.ljust(self.key_width, b'\0')
+        while i < self.count:
+            key = self._key(i)
+            if exact:
+                if key != padded:
+                    break
+            elif not key.startswith(prefix):
+                break
+            records.append(self._record(i))
+            i += 1
+        return records
+
+    def course(self, course):
+        '''Return the records of every section of course.'''
+
+        return self._records(to_bytes(course) + b'\0', False)
+
+    def section(self, course, section):
+        '''Return the records of one section of course.'''
+
+        return self._records(record_key(course, section), True)
+
+    def close(self):
+        self._map.close()
+
+
+_files = {}
+
+
+def get_file(db):
+    '''Return the LookupFile of database db, mapping it again if the file
+    was rebuilt since it was last mapped.'''
+
+    path = lookup_path(db)
+    st = os.stat(path)
+    lookup = _files.get(path)
+    if lookup is None or lookup.identity != (
+            st.st_dev, st.st_ino, st.st_size, st.st_mtime):
+        lookup = _files[path] = LookupFile(path)
+    return lookup
+
+
+def available(db):
+    '''Return True if db has a lookup file of this VERSION built from its
+    current contents.'''
+
+    try:
+        return get_file(db).db_stamp == db_stamp(db)
+    except (OSError, IOError, ValueError):
+        return False
+
+
+# the lookups of queries.py, answered from the lookup file, so this module
+# can be the engine of queries.find_exam
+
+def get_course_instructors(db, course):
+    return [row[:2] + row[6:] for row in get_file(db).course(course)]
+
+
+def get_course_time(db, course):
+    return [
+        (row[0], row[3], row[4]) for row in get_file(db).course(course)
+        if row[3] is not None]
+
+
+def get_course_time_section(db, course, section):
+    return [
+        (row[0], row[2], row[3], row[4])
+        for row in get_file(db).section(course, section)
+        if row[3] is not None]
+
+
+def get_locations(db, course):
+    return [
+        (row[0], row[1], row[5]) for row in get_file(db).course(course)
+        if row[5] is not None]
+
+
+if __name__ == '__main__':
+    # a one-off lookup without importing the query helpers
+    if len(sys.argv) < 2:
+        sys.exit("usage: lookupfile.py COURSE [SECTION] [DB]")
+    course = sys.argv[1]
+    section = sys.argv[2] if len(sys.argv) > 2 else None
+    db = sys.argv[3] if len(sys.argv) > 3 else 'exams.db'
+    if not available(db):
+        sys.exit("%s is missing or out of date, rebuild it with "
+                 "make_tables.py --lookup-file" % lookup_path(db))
+    if section is None:
+        rows = get_course_time(db, course)
+    else:
+        rows = get_course_time_section(db, course, section)
+    if not rows:
+        sys.exit("no exam found for %s" % course)
+    for row in rows:
+        print "Course %s has exam on %s at %s." % (
+            row[0], row[-2], row[-1])
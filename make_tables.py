@@ -1,24 +1,339 @@
 # create the tables
 
+import argparse
+import csv
+import hashlib
 import sqlite3
+from contextlib import contextmanager
+from itertools import count, groupby, islice
+from operator import itemgetter
+
+from examtime import exam_begins, exam_ends
+from lookupfile import lookup_path, write_lookup_file
+# the checks below share the pooled connections of the query helpers
+from queries import run_query
+
+# number of rows handed to executemany at a time
+CHUNK_SIZE = 10000
+
+# number of bytes read from a csv file at a time
+BLOCK_SIZE = 65536
+
+# secondary indexes for the lookups in queries.py, per table as
+# (index name, indexed columns)
+INDEXES = {
+    'Courses': [
+        # get_course_instructors, get_course_time, get_locations and
+        # check_conflicts filter on Course, get_course_time_section on
+        # Course and Sections; ID is included so the joins with Time and
+        # Locations are answered from the index alone
+        ('Courses_Course_Sections', 'Course, Sections, ID'),
+        ],
+    'Time': [
+        # fill_conflict_table reads the exams in date and start order
+        ('Time_Date_Start', 'Date, Start, ID'),
+        ],
+    'Locations': [],
+    'CourseInstructors': [
+        # courses_multi_instructors and courses_how_many_instructors
+        # count the instructors of each ID
+        ('CourseInstructors_ID', 'ID, Course'),
+        # the courses of one instructor
+        ('CourseInstructors_Instructor', 'Instructor, ID'),
+        ],
+    'ConflictSlots': [
+        # check_conflicts finds the slots of a course, then the other
+        # courses in those slots
+        ('ConflictSlots_Course', 'Course, Slot'),
+        ('ConflictSlots_Slot', 'Slot, Course'),
+        # incremental_load finds the slot of a date and start time
+        ('ConflictSlots_Date_Start', 'Date, Start, Slot'),
+        ],
+    'ExamSchedule': [
+        # get_course_time, get_course_time_section and get_locations
+        # read every column they return from this one index
+        ('ExamSchedule_Course',
+         'Course, Sections, ID, Date, Start, Room'),
+        # exams_between and exams_on read a range of start times
+        ('ExamSchedule_Begins', 'Begins'),
+        # incremental_load replaces the rows of the IDs that changed
+        ('ExamSchedule_ID', 'ID'),
+        ],
+    }
+
+# rows per page of table_page and iter_table
+PAGE_SIZE = 1000
+
+# a page of Courses, Time or Locations after a given ID; IDs are TEXT so
+# they sort as text and the empty string comes before every one of them
+TABLE_PAGE = '''SELECT * FROM %s WHERE ID > ? ORDER BY ID LIMIT ?'''
+
+# PRAGMAs used while bulk loading. The rollback journal stays on disk so
+# a load that dies part way is rolled back the next time the database is
+# opened; only an OS crash during the load can lose the old database.
+BULK_PRAGMAS = [
+    ('journal_mode', 'TRUNCATE'),
+    ('synchronous', 'OFF'),
+    # negative means KiB, so 256 MiB of page cache
+    ('cache_size', -262144),
+    ('temp_store', 'MEMORY'),
+    ]
+
+
+def iter_lines(csv_file, block_size=BLOCK_SIZE):
+    '''Yield the lines of csv_file one at a time, each ending with a
+    newline, whether the file uses CRLF, CR or LF line endings.'''
+
+    pending = ''
+    while True:
+        block = csv_file.read(block_size)
+        if not block:
+            break
+        data = pending + block
+        # hold back a final "\r", it may be the first half of a "\r\n"
+        cut = len(data) - 1 if data.endswith('\r') else len(data)
+        lines = data[:cut].replace('\r\n', '\n').replace('\r', '\n')
+        lines = lines.split('\n')
+        pending = lines.pop() + data[cut:]
+        for line in lines:
+            yield line + '\n'
+    # the last line may have no line ending at all
+    pending = pending.rstrip('\r')
+    if pending:
+        yield pending + '\n'
+
+
+def read_rows(csv_file):
+    '''Return an iterator over the rows of csv_file as lists of fields.
+    Quoted fields may contain commas and line breaks.'''
+
+    return csv.reader(iter_lines(csv_file))
+
+
+def chunks(rows, chunk_size=CHUNK_SIZE):
+    '''Yield lists of up to chunk_size rows of the iterable rows.'''
+
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        yield chunk
+
+
+def insert_rows(cur, statement, rows, chunk_size=CHUNK_SIZE):
+    '''Run the insert statement for every row of the iterable rows,
+    chunk_size rows at a time, so the rows are never all in memory.'''
+
+    for chunk in chunks(rows, chunk_size):
+        cur.executemany(statement, chunk)
+
+
+def location_rows(loc_file):
+    '''Yield the (ID, Room) rows of loc_file, commas in the room name
+    are kept.'''
+
+    return (
+        [row[0], ",".join(row[1:])]
+        for row in read_rows(loc_file) if len(row) >= 2)
+
+
+def course_rows(course_file):
+    '''Yield the (ID, Course, Section, Name) rows of course_file,
+    several instructors come as one quoted Name.'''
+
+    return (row for row in read_rows(course_file) if len(row) == 4)
+
+
+def time_rows(time_file):
+    '''Yield the (ID, Date, Start, End, Duration) rows of time_file,
+    skipping the header.'''
 
+    return (
+        row for row in read_rows(time_file)
+        if len(row) == 5 and not row[0].startswith("ID"))
 
-def create_location_table(db, loc_file):
-    '''Locations table has format ID, Room'''
+
+def instructor_rows(courses):
+    '''Yield an (ID, Course, Instructor) row for every instructor in the
+    comma separated Name of each (ID, Course, Sections, Name) row of
+    courses.'''
+
+    for row in courses:
+        seen = set()
+        for name in row[3].split(","):
+            name = name.strip()
+            if name and name not in seen:
+                seen.add(name)
+                yield row[0], row[1], name
+
+
+# the rows each table is loaded from
+ROW_READERS = {
+    'Courses': course_rows,
+    'Locations': location_rows,
+    'Time': time_rows,
+    }
+
+
+def create_indexes(cur, table):
+    '''Build the INDEXES of table in one pass over its rows and refresh
+    the statistics the query planner uses to pick them.'''
+
+    for name, columns in INDEXES[table]:
+        cur.execute(
+            '''CREATE INDEX IF NOT EXISTS %s ON %s (%s)''' % (
+                name, table, columns))
+    cur.execute('''ANALYZE %s''' % table)
+
+
+def build_indexes(db, tables=None):
+    '''Build the indexes of tables loaded with indexes=False, by default
+    of every table in INDEXES that db has.'''
 
     con = sqlite3.connect(db)
     cur = con.cursor()
+    if tables is None:
+        tables = [
+            table for table in sorted(INDEXES) if table_exists(cur, table)]
+    for table in tables:
+        create_indexes(cur, table)
+    con.commit()
+    cur.close()
+    con.close()
+
+
+def file_hash(csv_file, block_size=BLOCK_SIZE):
+    '''Return the sha1 hex digest of the content of csv_file and rewind
+    it to the start.'''
+
+    digest = hashlib.sha1()
+    while True:
+        block = csv_file.read(block_size)
+        if not block:
+            break
+        digest.update(block)
+    csv_file.seek(0)
+    return digest.hexdigest()
+
+
+def create_load_state(cur):
+    '''Create the LoadState table holding the hash of the file each
+    table was last reloaded from.'''
+
+    cur.execute(
+        '''CREATE TABLE IF NOT EXISTS LoadState '''
+        '''(Tbl TEXT PRIMARY KEY, Hash TEXT)''')
+
+
+def forget_hash(cur, table):
+    '''Remove the stored file hash of table, so the next incremental
+    reload compares it row by row.'''
+
+    create_load_state(cur)
+    cur.execute('''DELETE FROM LoadState WHERE Tbl = ?''', (table,))
+
+
+def reload_table(cur, table, csv_file):
+    '''Bring table up to date with csv_file through cursor cur: insert
+    new IDs, update changed rows and delete IDs no longer in the file.
+    Return the (inserted, updated, deleted) row counts and the set of IDs
+    changed, None on the first load of the table, or None if the file is
+    unchanged since the last reload and was skipped.'''
+
+    digest = file_hash(csv_file)
+    create_load_state(cur)
+    cur.execute(
+        '''SELECT Hash FROM LoadState WHERE Tbl = ?''', (table,))
+    row = cur.fetchone()
+    columns = [
+        info[1] for info in cur.execute('''PRAGMA table_info(%s)''' % table)]
+
+    if not columns:
+        # first load of this table
+        FILLERS[table](cur, csv_file)
+        rows = cur.execute('''SELECT count(*) FROM %s''' % table)
+        changes = (rows.fetchone()[0], 0, 0), None
+    elif row is not None and row[0] == digest:
+        return None
+    else:
+        changes = merge_rows(
+            cur, table, columns, ROW_READERS[table](csv_file))
+
+    cur.execute(
+        '''INSERT OR REPLACE INTO LoadState VALUES (?, ?)''', (table, digest))
+    return changes
+
+
+def merge_rows(cur, table, columns, rows):
+    '''Stage rows in a temporary table and apply only the differences
+    to table. Return the (inserted, updated, deleted) row counts and the
+    set of IDs inserted, updated or deleted.'''
+
+    cur.execute('''DROP TABLE IF EXISTS temp.Staging''')
+    cur.execute(
+        '''CREATE TEMP TABLE Staging AS SELECT * FROM %s WHERE 0''' % table)
+    insert_rows(
+        cur, '''INSERT INTO Staging VALUES (%s)''' % (
+            ", ".join("?" * len(columns))), rows)
+    cur.execute('''CREATE INDEX temp.Staging_ID ON Staging (ID)''')
+
+    # a row is new if its ID is missing, changed if any column differs
+    changed = " OR ".join(
+        "Old.%s IS NOT New.%s" % (column, column) for column in columns[1:])
+    ids = set(row[0] for row in cur.execute(
+        '''SELECT New.ID FROM Staging New LEFT JOIN %s Old '''
+        '''ON Old.ID = New.ID WHERE Old.ID IS NULL OR %s''' % (
+            table, changed or "0")))
+    ids.update(row[0] for row in cur.execute(
+        '''SELECT ID FROM %s WHERE ID NOT IN (SELECT ID FROM Staging)''' % (
+            table)))
+    inserted = cur.execute(
+        '''SELECT count(*) FROM Staging New LEFT JOIN %s Old '''
+        '''ON Old.ID = New.ID WHERE Old.ID IS NULL''' % table).fetchone()[0]
+    cur.execute(
+        '''INSERT OR REPLACE INTO %s SELECT New.* FROM Staging New '''
+        '''LEFT JOIN %s Old ON Old.ID = New.ID '''
+        '''WHERE Old.ID IS NULL OR %s''' % (table, table, changed or "0"))
+    updated = cur.rowcount - inserted
+    cur.execute(
+        '''DELETE FROM %s WHERE ID NOT IN (SELECT ID FROM Staging)''' % (
+            table))
+    deleted = cur.rowcount
+    cur.execute('''DROP TABLE temp.Staging''')
+    return (inserted, updated, deleted), ids
+
+
+def fill_location_table(cur, loc_file, indexes=True):
+    '''Drop and rebuild the Locations table through cursor cur without
+    committing.'''
+
     cur.execute('''DROP TABLE IF EXISTS Locations''')
+    forget_hash(cur, 'Locations')
     # create the table
     cur.execute('''CREATE TABLE Locations (ID TEXT UNIQUE, Room TEXT)''')
 
     # ADD THE rows
-    rows = []
-    for row in loc_file:
-        row = row.replace("\r\n", "").split(",", 1)
-        if len(row) == 2:
-            rows.append(row)
-    cur.executemany('insert into Locations values (?, ?)', rows)
+    insert_rows(
+        cur, 'insert into Locations values (?, ?)', location_rows(loc_file))
+
+    # index the rows in one pass now rather than on every insert
+    if indexes:
+        create_indexes(cur, 'Locations')
+
+
+def create_location_table(db, loc_file, indexes=True, derived=True):
+    '''Locations table has format ID, Room
+    Build the table's indexes after loading unless indexes is False.
+    ConflictSlots and ExamSchedule are rebuilt from the new table unless
+    derived is False; when loading several tables, pass False to all but
+    the last, or to all and call build_derived_tables after.'''
+
+    con = sqlite3.connect(db)
+    cur = con.cursor()
+    fill_location_table(cur, loc_file, indexes)
+    if derived:
+        fill_derived_tables(cur, indexes)
 
     # commit and close cursor and connection
     con.commit()
@@ -26,13 +341,12 @@ def create_location_table(db, loc_file):
     con.close()
 
 
-def create_course_table(db, course_file):
-    '''Courses Table should be ID,Course,Section,Name'''
-
-    con = sqlite3.connect(db)
-    cur = con.cursor()
+def fill_course_table(cur, course_file, indexes=True):
+    '''Drop and rebuild the Courses table through cursor cur without
+    committing.'''
 
     cur.execute('''DROP TABLE IF EXISTS Courses''')
+    forget_hash(cur, 'Courses')
 
     # create the table
     cur.execute(
@@ -40,13 +354,58 @@ def create_course_table(db, course_file):
         '''Course TEXT, Sections TEXT, Name TEXT)'''
         )
 
-    # Insert the rows
-    rows = []
-    for row in course_file:
-        row = row.replace("\r\n", "").split(",")
-        if len(row) == 4:
-            rows.append(row)
-    cur.executemany('insert into Courses values (?, ?, ?, ?)', rows)
+    # Insert the rows, and one row per instructor of each row into
+    # CourseInstructors as they are read
+    make_instructor_table(cur)
+    for chunk in chunks(course_rows(course_file)):
+        cur.executemany('insert into Courses values (?, ?, ?, ?)', chunk)
+        cur.executemany(
+            'insert into CourseInstructors values (?, ?, ?)',
+            instructor_rows(chunk))
+
+    # index the rows in one pass now rather than on every insert
+    if indexes:
+        create_indexes(cur, 'Courses')
+        create_indexes(cur, 'CourseInstructors')
+
+
+def make_instructor_table(cur):
+    '''Create an empty CourseInstructors table, the course of ID has
+    instructor Instructor.'''
+
+    cur.execute('''DROP TABLE IF EXISTS CourseInstructors''')
+    cur.execute(
+        '''CREATE TABLE CourseInstructors '''
+        '''(ID TEXT, Course TEXT, Instructor TEXT)''')
+
+
+def fill_instructor_table(cur, indexes=True):
+    '''Rebuild the CourseInstructors table from the Courses table
+    through cursor cur without committing.'''
+
+    make_instructor_table(cur)
+    reader = cur.connection.cursor()
+    reader.execute('''SELECT ID, Course, Sections, Name FROM Courses''')
+    insert_rows(
+        cur, 'insert into CourseInstructors values (?, ?, ?)',
+        instructor_rows(reader))
+    reader.close()
+    if indexes:
+        create_indexes(cur, 'CourseInstructors')
+
+
+def create_course_table(db, course_file, indexes=True, derived=True):
+    '''Courses Table should be ID,Course,Section,Name
+    Build the table's indexes after loading unless indexes is False.
+    ConflictSlots and ExamSchedule are rebuilt from the new table unless
+    derived is False; when loading several tables, pass False to all but
+    the last, or to all and call build_derived_tables after.'''
+
+    con = sqlite3.connect(db)
+    cur = con.cursor()
+    fill_course_table(cur, course_file, indexes)
+    if derived:
+        fill_derived_tables(cur, indexes)
 
     # commit and close the cursor and connection
     con.commit()
@@ -54,26 +413,38 @@ def create_course_table(db, course_file):
     con.close()
 
 
-def create_time_table(db, time_file):
-    '''Time Table should be ID,Date,Start,End,Duration
-    '''
-
-    con = sqlite3.connect(db)
-    cur = con.cursor()
+def fill_time_table(cur, time_file, indexes=True):
+    '''Drop and rebuild the Time table through cursor cur without
+    committing.'''
 
     cur.execute('''DROP TABLE IF EXISTS Time''')
+    forget_hash(cur, 'Time')
     # create the table
     cur.execute(
         '''CREATE TABLE Time (ID TEXT UNIQUE, '''
         '''Date TEXT, Start TEXT, End TEXT, Duration TEXT)''')
 
     # insert the rows
-    rows = []
-    for row in time_file.readlines()[0].split("\r"):
-        if not row.startswith("ID"):
-            row = row.replace("\r", "")
-            rows.append(row.split(","))
-    cur.executemany('insert into Time values (?, ?, ?, ?, ?)', rows)
+    insert_rows(
+        cur, 'insert into Time values (?, ?, ?, ?, ?)', time_rows(time_file))
+
+    # index the rows in one pass now rather than on every insert
+    if indexes:
+        create_indexes(cur, 'Time')
+
+
+def create_time_table(db, time_file, indexes=True, derived=True):
+    '''Time Table should be ID,Date,Start,End,Duration
+    Build the table's indexes after loading unless indexes is False.
+    ConflictSlots and ExamSchedule are rebuilt from the new table unless
+    derived is False; when loading several tables, pass False to all but
+    the last, or to all and call build_derived_tables after.'''
+
+    con = sqlite3.connect(db)
+    cur = con.cursor()
+    fill_time_table(cur, time_file, indexes)
+    if derived:
+        fill_derived_tables(cur, indexes)
 
     # commit and close the cursor and connection
     con.commit()
@@ -81,24 +452,338 @@ def create_time_table(db, time_file):
     con.close()
 
 
-def run_query(db, q, args=None):
-    """(str, str, tuple) -> list of tuple
-        Return the results of running query q with arguments args on
-        database db."""
+def table_exists(cur, table):
+    '''Return True if the database of cur has a table named table.'''
 
-    conn = sqlite3.connect(db)
-    cur = conn.cursor()
-    # execute the query with the given args passed
-    # if args is None, we have only a query
-    if args is None:
-        cur.execute(q)
-    else:
-        cur.execute(q, args)
+    cur.execute(
+        '''SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?''',
+        (table,))
+    return cur.fetchone() is not None
+
+
+def slot_rows(exams, slot_number):
+    '''Yield a (Slot, ID, Course, Sections, Date, Start) row for every
+    exam of exams, (Date, Start, Course, Sections, ID) rows sorted by
+    date and start time, that shares its date and start time with
+    another course. slot_number(date, start) gives the Slot of each.'''
+
+    for (date, start), slot in groupby(exams, itemgetter(0, 1)):
+        slot = list(slot)
+        # sections of the same course at the same time are no conflict
+        if len(set(exam[2] for exam in slot)) > 1:
+            number = slot_number(date, start)
+            for exam in slot:
+                yield (number, exam[4], exam[2], exam[3], date, start)
+
+
+def conflict_rows(cur):
+    '''Yield the rows of slot_rows for every section, numbering each
+    shared date and start time as one slot. The exams are read once,
+    sorted by date and start time.'''
+
+    reader = cur.connection.cursor()
+    reader.execute(
+        '''SELECT Time.Date, Time.Start, Courses.Course, Courses.Sections, '''
+        '''Courses.ID FROM Time INNER JOIN Courses '''
+        '''ON Courses.ID == Time.ID ORDER BY Time.Date, Time.Start''')
+    numbers = count(1)
+    for row in slot_rows(reader, lambda date, start: next(numbers)):
+        yield row
+    reader.close()
+
+
+def fill_conflict_table(cur, indexes=True):
+    '''Rebuild the ConflictSlots table from the Courses and Time tables
+    through cursor cur without committing. It is left empty until both
+    tables are loaded.'''
+
+    cur.execute('''DROP TABLE IF EXISTS ConflictSlots''')
+    cur.execute(
+        '''CREATE TABLE ConflictSlots (Slot INTEGER, ID TEXT, '''
+        '''Course TEXT, Sections TEXT, Date TEXT, Start TEXT)''')
+    if table_exists(cur, 'Courses') and table_exists(cur, 'Time'):
+        insert_rows(
+            cur, '''INSERT INTO ConflictSlots VALUES (?, ?, ?, ?, ?, ?)''',
+            conflict_rows(cur))
+    if indexes:
+        create_indexes(cur, 'ConflictSlots')
+
+
+def fill_schedule_table(cur, indexes=True):
+    '''Rebuild the ExamSchedule table from the Courses, Time and
+    Locations tables through cursor cur without committing. It has one
+    row per section with its exam time and room, NULL where Time or
+    Locations has no row for it, and is left empty until all three tables
+    are loaded. Begins and Ends are the exam's start and end in minutes
+    since 1970-01-01, NULL when the date or time cannot be read.'''
+
+    cur.execute('''DROP TABLE IF EXISTS ExamSchedule''')
+    cur.execute(
+        '''CREATE TABLE ExamSchedule (Course TEXT, Sections TEXT, '''
+        '''ID TEXT, Date TEXT, Start TEXT, End TEXT, Room TEXT, '''
+        '''Instructors TEXT, Begins INTEGER, Ends INTEGER)''')
+    if all(table_exists(cur, table)
+           for table in ('Courses', 'Time', 'Locations')):
+        cur.connection.create_function('exam_begins', 2, exam_begins)
+        cur.connection.create_function('exam_ends', 4, exam_ends)
+        cur.execute(SCHEDULE_ROWS % '1')
+    if indexes:
+        create_indexes(cur, 'ExamSchedule')
+
+
+# the ExamSchedule rows of the sections meeting the condition %s; the IDs
+# of Time and Locations are unique, so every section joins at most one
+# row of each
+SCHEDULE_ROWS = '''INSERT INTO ExamSchedule SELECT Courses.Course, ''' \
+    '''Courses.Sections, Courses.ID, Time.Date, Time.Start, ''' \
+    '''Time.End, Locations.Room, Courses.Name, ''' \
+    '''exam_begins(Time.Date, Time.Start), ''' \
+    '''exam_ends(Time.Date, Time.Start, Time.End, Time.Duration) ''' \
+    '''FROM Courses ''' \
+    '''LEFT JOIN Time ON Time.ID == Courses.ID ''' \
+    '''LEFT JOIN Locations ON Locations.ID == Courses.ID ''' \
+    '''WHERE (Time.ID IS NOT NULL OR Locations.ID IS NOT NULL) AND %s'''
+
+# the IDs in temp.Changed
+CHANGED = '''(SELECT ID FROM temp.Changed)'''
+
+
+def stage_ids(cur, ids):
+    '''Put ids in the temporary table Changed, replacing its content.'''
+
+    cur.execute('''DROP TABLE IF EXISTS temp.Changed''')
+    cur.execute('''CREATE TEMP TABLE Changed (ID TEXT PRIMARY KEY)''')
+    insert_rows(
+        cur, '''INSERT INTO temp.Changed VALUES (?)''',
+        ((id_,) for id_ in ids))
+    # without statistics the planner takes it for a large table and
+    # scans the others instead of looking up each ID
+    cur.execute('''ANALYZE temp.Changed''')
+
+
+def update_instructor_rows(cur):
+    '''Rebuild the CourseInstructors rows of the IDs in temp.Changed.'''
+
+    cur.execute(
+        '''DELETE FROM CourseInstructors WHERE ID IN %s''' % CHANGED)
+    reader = cur.connection.cursor()
+    reader.execute(
+        '''SELECT ID, Course, Sections, Name FROM Courses '''
+        '''WHERE ID IN %s''' % CHANGED)
+    insert_rows(
+        cur, 'insert into CourseInstructors values (?, ?, ?)',
+        instructor_rows(reader))
+    reader.close()
+
+
+def update_conflict_slots(cur):
+    '''Rebuild the ConflictSlots rows of the dates and start times the
+    exams of the IDs in temp.Changed had and now have. Slots keep their
+    number, new ones are numbered after the last. Run it before
+    update_schedule_rows, ExamSchedule holds the times they had.'''
+
+    cur.execute('''DROP TABLE IF EXISTS temp.Slots''')
+    cur.execute(
+        '''CREATE TEMP TABLE Slots (Date TEXT, Start TEXT, '''
+        '''PRIMARY KEY (Date, Start))''')
+    for table in ('ExamSchedule', 'Time'):
+        cur.execute(
+            '''INSERT OR IGNORE INTO temp.Slots SELECT Date, Start '''
+            '''FROM %s WHERE ID IN %s''' % (table, CHANGED))
+    cur.execute('''ANALYZE temp.Slots''')
+
+    numbers = dict(
+        ((date, start), slot) for slot, date, start in cur.execute(
+            '''SELECT DISTINCT ConflictSlots.Slot, Slots.Date, '''
+            '''Slots.Start FROM temp.Slots INNER JOIN ConflictSlots '''
+            '''ON ConflictSlots.Date = Slots.Date '''
+            '''AND ConflictSlots.Start = Slots.Start''').fetchall())
+    cur.executemany(
+        '''DELETE FROM ConflictSlots WHERE Slot = ?''',
+        [(slot,) for slot in numbers.values()])
+    last = cur.execute(
+        '''SELECT max(Slot) FROM ConflictSlots''').fetchone()[0]
+    new_numbers = count(max([last or 0] + numbers.values()) + 1)
+
+    reader = cur.connection.cursor()
+    reader.execute(
+        '''SELECT Time.Date, Time.Start, Courses.Course, Courses.Sections, '''
+        '''Courses.ID FROM temp.Slots INNER JOIN Time '''
+        '''ON Time.Date = Slots.Date AND Time.Start = Slots.Start '''
+        '''INNER JOIN Courses ON Courses.ID == Time.ID '''
+        '''ORDER BY Time.Date, Time.Start''')
+    insert_rows(
+        cur, '''INSERT INTO ConflictSlots VALUES (?, ?, ?, ?, ?, ?)''',
+        slot_rows(reader, lambda date, start: numbers.get(
+            (date, start)) or next(new_numbers)))
+    reader.close()
+    cur.execute('''DROP TABLE temp.Slots''')
+
+
+def update_schedule_rows(cur):
+    '''Rebuild the ExamSchedule rows of the IDs in temp.Changed.'''
+
+    cur.connection.create_function('exam_begins', 2, exam_begins)
+    cur.connection.create_function('exam_ends', 4, exam_ends)
+    cur.execute('''DELETE FROM ExamSchedule WHERE ID IN %s''' % CHANGED)
+    cur.execute(SCHEDULE_ROWS % ('Courses.ID IN %s' % CHANGED))
+
+
+def build_conflicts(db):
+    '''Rebuild the ConflictSlots table of db.'''
 
-    results = cur.fetchall()
+    con = sqlite3.connect(db)
+    cur = con.cursor()
+    fill_conflict_table(cur)
+    con.commit()
     cur.close()
-    conn.close()
-    return results
+    con.close()
+
+
+def fill_derived_tables(cur, indexes=True):
+    '''Rebuild the ConflictSlots and ExamSchedule tables from the
+    Courses, Time and Locations tables through cursor cur without
+    committing.'''
+
+    fill_conflict_table(cur, indexes)
+    fill_schedule_table(cur, indexes)
+
+
+def build_derived_tables(db, indexes=True):
+    '''Rebuild the ConflictSlots and ExamSchedule tables of db from the
+    Courses, Time and Locations tables. Run it once after loading several
+    tables with create_*_table(..., derived=False), so the derived tables
+    are built once per reload and never from a mix of new and old
+    tables.'''
+
+    con = sqlite3.connect(db)
+    cur = con.cursor()
+    fill_derived_tables(cur, indexes)
+    con.commit()
+    cur.close()
+    con.close()
+
+
+def set_pragmas(cur, pragmas):
+    '''Set each (name, value) PRAGMA in pragmas and return the list of
+    (name, value) pairs they had before.'''
+
+    previous = []
+    for name, value in pragmas:
+        previous.append((name, cur.execute('PRAGMA %s' % name).fetchone()[0]))
+        cur.execute('PRAGMA %s = %s' % (name, value))
+    return previous
+
+
+@contextmanager
+def bulk_transaction(db):
+    '''Yield a cursor on db inside one transaction with the BULK_PRAGMAS
+    set. The transaction is committed at the end of the with block, or
+    rolled back, leaving the database exactly as it was, on an error.'''
+
+    # manage the transaction by hand, otherwise sqlite3 commits before
+    # every DROP and CREATE
+    con = sqlite3.connect(db, isolation_level=None)
+    cur = con.cursor()
+    saved = set_pragmas(cur, BULK_PRAGMAS)
+    try:
+        cur.execute('''BEGIN IMMEDIATE''')
+        try:
+            yield cur
+        except BaseException:
+            cur.execute('''ROLLBACK''')
+            raise
+        cur.execute('''COMMIT''')
+    finally:
+        set_pragmas(cur, saved)
+        cur.close()
+        con.close()
+
+
+def bulk_load(db, course_file, loc_file, time_file, indexes=True):
+    '''Load the Courses, Locations and Time tables through one connection
+    in one transaction. If any table fails to load, the database is left
+    exactly as it was.'''
+
+    with bulk_transaction(db) as cur:
+        fill_course_table(cur, course_file, indexes)
+        fill_location_table(cur, loc_file, indexes)
+        fill_time_table(cur, time_file, indexes)
+        fill_derived_tables(cur, indexes)
+
+
+# the full loaders of each table, used for a first incremental reload
+FILLERS = {
+    'Courses': fill_course_table,
+    'Locations': fill_location_table,
+    'Time': fill_time_table,
+    }
+
+
+def incremental_load(db, course_file, loc_file, time_file):
+    '''Apply only the changes in the three csv files to the tables, in
+    one transaction. Files unchanged since the last reload are skipped.
+    Return a dict of table name to the result of reload_table.'''
+
+    changes = {}
+    # table -> IDs changed, None if loaded whole
+    changed = {}
+    with bulk_transaction(db) as cur:
+        for table, csv_file in [
+                ('Courses', course_file), ('Locations', loc_file),
+                ('Time', time_file)]:
+            result = reload_table(cur, table, csv_file)
+            changes[table] = None
+            if result is not None:
+                changes[table], changed[table] = result
+        update_derived_tables(cur, changed)
+    return changes
+
+
+def update_derived_tables(cur, changed):
+    '''Bring CourseInstructors, ConflictSlots and ExamSchedule up to date
+    through cursor cur after a reload, changed mapping each table
+    reloaded to the set of IDs changed, or to None if it was loaded
+    whole. Only the rows of the changed IDs and the conflict slots of
+    their exam times are rebuilt, so the time taken follows the size of
+    the change; a table loaded whole or a missing derived table is
+    rebuilt in full.'''
+
+    # the IDs changed in tables, None if one of them was loaded whole
+    def ids(*tables):
+        found = set()
+        for table in tables:
+            if table in changed:
+                if changed[table] is None:
+                    return None
+                found.update(changed[table])
+        return found
+
+    courses = ids('Courses')
+    if courses is None or not table_exists(cur, 'CourseInstructors'):
+        fill_instructor_table(cur)
+    elif courses:
+        stage_ids(cur, courses)
+        update_instructor_rows(cur)
+
+    # the conflict slots are found from the times in ExamSchedule, so
+    # without it both tables are built in full
+    schedule = table_exists(cur, 'ExamSchedule')
+    exams = ids('Courses', 'Time')
+    if exams is None or not schedule or not table_exists(
+            cur, 'ConflictSlots'):
+        fill_conflict_table(cur)
+    elif exams:
+        stage_ids(cur, exams)
+        update_conflict_slots(cur)
+
+    sections = ids('Courses', 'Time', 'Locations')
+    if sections is None or not schedule:
+        fill_schedule_table(cur)
+    elif sections:
+        stage_ids(cur, sections)
+        update_schedule_rows(cur)
+    cur.execute('''DROP TABLE IF EXISTS temp.Changed''')
 
 
 def check_courses(db):
@@ -119,22 +804,100 @@ def check_rooms(db):
     return run_query(db, '''SELECT * FROM Locations''')
 
 
+def table_page(db, table, after='', limit=PAGE_SIZE):
+    '''Return up to limit rows of table with an ID after after, in ID
+    order. Pass the ID of the last row returned as after to get the next
+    page; each page is one seek on the ID index however deep it is.'''
+
+    return run_query(db, TABLE_PAGE % table, (after, limit))
+
+
+def check_courses_page(db, after='', limit=PAGE_SIZE):
+    '''Return a page of the Courses table as in table_page.'''
+
+    return table_page(db, 'Courses', after, limit)
+
+
+def check_time_page(db, after='', limit=PAGE_SIZE):
+    '''Return a page of the Time table as in table_page.'''
+
+    return table_page(db, 'Time', after, limit)
+
+
+def check_rooms_page(db, after='', limit=PAGE_SIZE):
+    '''Return a page of the Locations table as in table_page.'''
+
+    return table_page(db, 'Locations', after, limit)
+
+
+def iter_table(db, table, page_size=PAGE_SIZE):
+    '''Yield every row of table in ID order, reading one page at a time
+    so memory stays constant and no connection is held between pages.'''
+
+    after = ''
+    while True:
+        page = table_page(db, table, after, page_size)
+        for row in page:
+            yield row
+        if len(page) < page_size:
+            break
+        after = page[-1][0]
+
+
 if __name__ == '__main__':
 
+    parser = argparse.ArgumentParser(description="Build exams.db")
+    parser.add_argument(
+        "--no-indexes", dest="indexes", action="store_false",
+        help="skip building the indexes, for throwaway loads")
+    parser.add_argument(
+        "--bulk", action="store_true",
+        help="load all tables in one transaction, all or nothing")
+    parser.add_argument(
+        "--incremental", action="store_true",
+        help="only apply the rows that changed since the last reload")
+    parser.add_argument(
+        "--lookup-file", action="store_true",
+        help="also write exams.lookup for fast one-off lookups")
+    options = parser.parse_args()
+
     # open the necessary files
     location_csv = open("./locations.csv", 'rb')
     time_csv = open("./time.csv", 'rb')
     courses_csv = open("./courses.csv", 'rb')
     database_name = "./exams.db"
     # create the tables
-    create_course_table(database_name, courses_csv)
-    create_location_table(database_name, location_csv)
-    create_time_table(database_name, time_csv)
+    if options.incremental:
+        changes = incremental_load(
+            database_name, courses_csv, location_csv, time_csv)
+        for table in sorted(changes):
+            if changes[table] is None:
+                print "%s unchanged" % table
+            else:
+                print "%s: %d inserted, %d updated, %d deleted" % (
+                    (table,) + changes[table])
+    elif options.bulk:
+        bulk_load(
+            database_name, courses_csv, location_csv, time_csv,
+            options.indexes)
+    else:
+        # the derived tables are built once, from all three new tables
+        create_course_table(
+            database_name, courses_csv, options.indexes, derived=False)
+        create_location_table(
+            database_name, location_csv, options.indexes, derived=False)
+        create_time_table(
+            database_name, time_csv, options.indexes, derived=False)
+        build_derived_tables(database_name, options.indexes)
     # close the files
     location_csv.close()
     time_csv.close()
     courses_csv.close()
 
+    if options.lookup_file:
+        print "%d sections in %s" % (
+            write_lookup_file(database_name), lookup_path(database_name))
+
     raw_input("Checking courses")
     print check_courses(database_name)
     raw_input("Checking locations")
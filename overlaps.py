@@ -0,0 +1,110 @@
+# find rooms and instructors booked for two exams at the same time
+
+import csv
+import heapq
+import sys
+from itertools import groupby
+from operator import itemgetter
+
+from examtime import exam_span
+from pool import get_pool
+
+# every exam with its room, sorted so each room's exams come together
+ROOM_EXAMS = '''SELECT Locations.Room, Courses.Course, Courses.Sections, ''' \
+    '''Courses.ID, Time.Date, Time.Start, Time.End, Time.Duration ''' \
+    '''FROM Time INNER JOIN Courses ON Courses.ID == Time.ID ''' \
+    '''INNER JOIN Locations ON Locations.ID == Time.ID ''' \
+    '''ORDER BY Locations.Room'''
+
+# every exam of every instructor, sorted so each instructor's exams come
+# together
+INSTRUCTOR_EXAMS = '''SELECT CourseInstructors.Instructor, ''' \
+    '''Courses.Course, Courses.Sections, Courses.ID, Time.Date, ''' \
+    '''Time.Start, Time.End, Time.Duration FROM CourseInstructors ''' \
+    '''INNER JOIN Courses ON Courses.ID == CourseInstructors.ID ''' \
+    '''INNER JOIN Time ON Time.ID == CourseInstructors.ID ''' \
+    '''ORDER BY CourseInstructors.Instructor'''
+
+
+def exam_interval(row):
+    '''Return (begin, end, exam) for a row of ROOM_EXAMS or
+    INSTRUCTOR_EXAMS without its first column, where exam is the
+    (Course, Sections, ID, Date, Start, End) tuple. Return None if the
+    exam time cannot be read.'''
+
+    span = exam_span(row[3], row[4], row[5], row[6])
+    if span is None:
+        return None
+    return span[0], span[1], tuple(row[:6])
+
+
+def sweep(intervals):
+    '''Yield every (earlier, later) pair of overlapping exams among the
+    (begin, end, exam) intervals, which must be sorted by begin. Only
+    the exams still running when the next one begins are compared, so
+    this is O(n log n) plus the number of overlaps. Sections of the same
+    course are one exam and never overlap each other.'''
+
+    running = []
+    for n, (begin, end, exam) in enumerate(intervals):
+        while running and running[0][0] <= begin:
+            heapq.heappop(running)
+        for _, _, other in running:
+            if other[0] != exam[0]:
+                yield other, exam
+        heapq.heappush(running, (end, n, exam))
+
+
+def grouped_double_bookings(db, statement):
+    '''Yield (booked, exam, other) for every pair of exams of different
+    courses at overlapping times that share the first column of
+    statement, one value of that column at a time.'''
+
+    with get_pool(db).connection() as conn:
+        rows = conn.execute(statement)
+        for booked, exams in groupby(rows, itemgetter(0)):
+            intervals = filter(
+                None, (exam_interval(row[1:]) for row in exams))
+            intervals.sort()
+            for exam, other in sweep(intervals):
+                yield booked, exam, other
+
+
+def room_double_bookings(db):
+    '''Yield (room, exam, other) for every pair of exams of different
+    courses in the same room at overlapping times, one room at a time.'''
+
+    return grouped_double_bookings(db, ROOM_EXAMS)
+
+
+def instructor_double_bookings(db):
+    '''Yield (instructor, exam, other) for every pair of exams of
+    different courses with a shared instructor at overlapping times, one
+    instructor at a time.'''
+
+    return grouped_double_bookings(db, INSTRUCTOR_EXAMS)
+
+
+def double_bookings(db):
+    '''Yield ("room", room, exam, other) and then ("instructor", name,
+    exam, other) for every double booking in db as it is found.'''
+
+    for room, exam, other in room_double_bookings(db):
+        yield "room", room, exam, other
+    for name, exam, other in instructor_double_bookings(db):
+        yield "instructor", name, exam, other
+
+
+if __name__ == '__main__':
+    db = sys.argv[1] if len(sys.argv) > 1 else 'exams.db'
+
+    # write each double booking out as soon as it is found
+    writer = csv.writer(sys.stdout)
+    writer.writerow([
+        "Kind", "Booked", "Course", "Sections", "ID", "Date", "Start", "End",
+        "OtherCourse", "OtherSections", "OtherID", "OtherDate", "OtherStart",
+        "OtherEnd"])
+    for kind, booked, exam, other in double_bookings(db):
+        writer.writerow(
+            [kind, booked.encode('utf-8')] +
+            [value.encode('utf-8') for value in exam + other])
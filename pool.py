@@ -0,0 +1,231 @@
+# keep sqlite connections open between queries
+
+import atexit
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from Queue import Queue, Empty, Full
+
+# number of connections each database keeps open, 1 means one connection
+# shared by the whole process
+POOL_SIZE = 4
+
+# seconds to wait for a free connection before giving up
+POOL_TIMEOUT = 30
+
+# number of prepared statements each connection keeps for reuse
+STATEMENT_CACHE_SIZE = 100
+
+
+def file_identity(path):
+    '''Return the (device, inode) of the file at path, None if there is
+    none.'''
+
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_dev, st.st_ino
+
+
+class ConnectionPool(object):
+    '''A fixed size pool of open connections to one database file. A
+    connection is dropped instead of reused once the path names another
+    file, so replacing the database, by renaming a rebuilt one over it or
+    by deleting and rebuilding it, is seen by the next query.'''
+
+    def __init__(self, db, size=None, timeout=None, cached_statements=None):
+        self.db = db
+        self.size = POOL_SIZE if size is None else size
+        self.timeout = POOL_TIMEOUT if timeout is None else timeout
+        if cached_statements is None:
+            cached_statements = STATEMENT_CACHE_SIZE
+        self.cached_statements = cached_statements
+        self.closed = False
+        self._idle = Queue(self.size)
+        self._created = 0
+        self._lock = threading.Lock()
+        # the file identity of each open connection
+        self._files = {}
+
+    def _connect(self):
+        # taken before connecting: should the file be replaced in between,
+        # the connection is only dropped once more than needed
+        identity = file_identity(self.db)
+        # connections move between threads, but only one thread
+        # holds a given connection at a time
+        conn = sqlite3.connect(
+            self.db, check_same_thread=False,
+            cached_statements=self.cached_statements)
+        self._files[conn] = identity or file_identity(self.db)
+        return conn
+
+    def _stale(self, conn, identity):
+        '''Return True if conn was opened on a file other than the one
+        with identity.'''
+
+        return self._files.get(conn) != identity
+
+    def _checkout(self):
+        '''Return an idle connection, opening a new one if the pool
+        has not reached its size yet.'''
+
+        if self.closed:
+            raise sqlite3.ProgrammingError("Cannot use a closed pool.")
+        identity = file_identity(self.db)
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except Empty:
+                break
+            if not self._stale(conn, identity):
+                return conn
+            self._discard(conn)
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                try:
+                    return self._connect()
+                except Exception:
+                    self._created -= 1
+                    raise
+        try:
+            conn = self._idle.get(True, self.timeout)
+        except Empty:
+            raise sqlite3.OperationalError(
+                "No free connection to %s after %s seconds" % (
+                    self.db, self.timeout))
+        if self._stale(conn, identity):
+            # a connection was handed back, so the pool is below its size
+            self._discard(conn)
+            return self._checkout()
+        return conn
+
+    def _checkin(self, conn):
+        if self.closed:
+            self._discard(conn)
+            return
+        try:
+            self._idle.put_nowait(conn)
+        except Full:
+            self._discard(conn)
+
+    def _discard(self, conn):
+        with self._lock:
+            self._created -= 1
+            self._files.pop(conn, None)
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    @contextmanager
+    def connection(self):
+        '''Borrow a connection for the duration of a with block.'''
+
+        conn = self._checkout()
+        try:
+            yield conn
+        except sqlite3.Error:
+            # a failed statement may have left the connection unusable
+            if healthy(conn):
+                conn.rollback()
+                self._checkin(conn)
+            else:
+                self._discard(conn)
+            raise
+        except BaseException:
+            self._discard(conn)
+            raise
+        else:
+            self._checkin(conn)
+
+    def check(self):
+        '''Ping every idle connection and drop the ones that fail or
+        were opened on a file the path no longer names. Return the number
+        of connections dropped.'''
+
+        identity = file_identity(self.db)
+        dropped = 0
+        for _ in range(self._idle.qsize()):
+            try:
+                conn = self._idle.get_nowait()
+            except Empty:
+                break
+            if healthy(conn) and not self._stale(conn, identity):
+                self._checkin(conn)
+            else:
+                self._discard(conn)
+                dropped += 1
+        return dropped
+
+    def close(self):
+        '''Close all idle connections. Connections still in use are
+        closed when they are handed back.'''
+
+        self.closed = True
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except Empty:
+                break
+            self._discard(conn)
+
+
+def healthy(conn):
+    '''Return True if conn can still run a statement.'''
+
+    try:
+        conn.execute('SELECT 1').fetchone()
+    except sqlite3.Error:
+        return False
+    return True
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+_pools_pid = os.getpid()
+
+
+def get_pool(db):
+    '''Return the shared pool for database db, creating it if needed.'''
+
+    global _pools_pid
+    pool = _pools.get(db)
+    if pool is not None and _pools_pid == os.getpid():
+        return pool
+    with _pools_lock:
+        if _pools_pid != os.getpid():
+            # connections must not be shared with a forked parent
+            _pools.clear()
+            _pools_pid = os.getpid()
+        pool = _pools.get(db)
+        if pool is None:
+            pool = _pools[db] = ConnectionPool(db)
+    return pool
+
+
+def configure(size=None, timeout=None, cached_statements=None):
+    '''Change the size, timeout and statement cache size used for pools
+    created from now on.'''
+
+    global POOL_SIZE, POOL_TIMEOUT, STATEMENT_CACHE_SIZE
+    if size is not None:
+        POOL_SIZE = size
+    if timeout is not None:
+        POOL_TIMEOUT = timeout
+    if cached_statements is not None:
+        STATEMENT_CACHE_SIZE = cached_statements
+
+
+def close_all():
+    '''Close every pool, used on interpreter exit.'''
+
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
+
+
+atexit.register(close_all)
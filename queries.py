@@ -1,4 +1,114 @@
-import sqlite3
+import argparse
+import csv
+import json
+import sys
+from collections import OrderedDict
+from datetime import datetime
+from itertools import groupby, islice
+from operator import itemgetter
+
+import lookupfile
+import snapshot
+from cache import ResultCache
+from examtime import to_minutes
+from pool import get_pool
+from querylog import QueryTracer
+from suggest import suggest
+
+# every statement is written once with ? placeholders, so each connection
+# prepares it once and then reuses it from its statement cache
+# (pool.STATEMENT_CACHE_SIZE) whatever the arguments are
+COURSE_INSTRUCTORS = '''SELECT Course, Sections, Name FROM Courses ''' \
+    '''WHERE Course = ?'''
+
+# make_tables keeps the exam time and room of every section in
+# ExamSchedule, NULL when the section has no Time or Locations row, so
+# the lookups below read one index instead of joining the tables
+COURSE_TIME = '''SELECT Course, Date, Start FROM ExamSchedule ''' \
+    '''WHERE Course = ? AND Date IS NOT NULL'''
+
+COURSE_TIME_SECTION = '''SELECT Course, ID, Date, Start FROM ''' \
+    '''ExamSchedule WHERE Course = ? AND Sections = ? ''' \
+    '''AND Date IS NOT NULL'''
+
+# make_tables keeps one CourseInstructors row per instructor of each ID
+MULTI_INSTRUCTORS = '''SELECT Course, Name FROM Courses WHERE ID IN ''' \
+    '''(SELECT ID FROM CourseInstructors GROUP BY ID ''' \
+    '''HAVING count(*) > 1)'''
+
+COUNT_INSTRUCTORS = '''SELECT Course, count(*) FROM CourseInstructors ''' \
+    '''GROUP BY ID HAVING count(*) > 1'''
+
+# the courses of a department are a contiguous range of the
+# Courses_Course_Sections index, Course >= dept and Course < the next
+# possible prefix after dept
+DEPT_COURSES = '''SELECT Course FROM Courses ''' \
+    '''WHERE Course >= ? AND Course < ?'''
+
+DEPT_COUNT = '''SELECT count(*) FROM Courses ''' \
+    '''WHERE Course >= ? AND Course < ?'''
+
+LOCATIONS = '''SELECT Course, Sections, Room FROM ExamSchedule ''' \
+    '''WHERE Course = ? AND Room IS NOT NULL'''
+
+# make_tables puts every section whose exam shares its date and start
+# time with another course into ConflictSlots, one Slot number per shared
+# date and start time
+CONFLICTS = '''SELECT DISTINCT Other.Course FROM ConflictSlots Mine ''' \
+    '''INNER JOIN ConflictSlots Other ON Other.Slot = Mine.Slot ''' \
+    '''WHERE Mine.Course = ? AND Other.Course != Mine.Course ''' \
+    '''ORDER BY Other.Course'''
+
+# in date and start order rather than by Slot, the slots an incremental
+# reload adds are numbered after the others
+ALL_CONFLICTS = '''SELECT Slot, Date, Start, Course, Sections ''' \
+    '''FROM ConflictSlots ORDER BY Date, Start, Course, Sections'''
+
+# batch versions of the statements above: the first column (two for
+# sections) is the key the row belongs to, and %s is the IN list
+COURSE_INSTRUCTORS_BATCH = '''SELECT Course, Course, Sections, Name ''' \
+    '''FROM Courses WHERE Course IN (%s)'''
+
+COURSE_TIME_BATCH = '''SELECT Course, Course, Date, Start ''' \
+    '''FROM ExamSchedule WHERE Course IN (%s) AND Date IS NOT NULL'''
+
+COURSE_TIME_SECTION_BATCH = '''SELECT Course, Sections, Course, ID, ''' \
+    '''Date, Start FROM ExamSchedule ''' \
+    '''WHERE (Course, Sections) IN (VALUES %s) AND Date IS NOT NULL'''
+
+LOCATIONS_BATCH = '''SELECT Course, Course, Sections, Room ''' \
+    '''FROM ExamSchedule WHERE Course IN (%s) AND Room IS NOT NULL'''
+
+# every section with an exam of each course, to resolve many find_exam
+# lookups at once
+EXAM_BATCH = '''SELECT Course, Sections, Date, Start ''' \
+    '''FROM ExamSchedule WHERE Course IN (%s) AND Date IS NOT NULL'''
+
+# exams by start time, Begins being minutes since 1970-01-01 as computed
+# by make_tables; both read a range of the ExamSchedule_Begins index
+EXAMS_BETWEEN = '''SELECT Course, Sections, Date, Start, End, Room ''' \
+    '''FROM ExamSchedule WHERE Begins >= ? AND Begins < ? ''' \
+    '''ORDER BY Begins, Course, Sections'''
+
+# the earliest exam from a given time on of each course; with min() the
+# other columns come from the row holding the minimum
+NEXT_EXAM_BATCH = '''SELECT Course, Sections, Date, Start, Room, ''' \
+    '''min(Begins) FROM ExamSchedule ''' \
+    '''WHERE Course IN (%s) AND Begins >= ? GROUP BY Course'''
+
+# most keys bound by one batch statement, well below SQLite's limit of
+# 999 variables; smaller batches are padded to a power of two so only a
+# few distinct statements are ever prepared
+BATCH_SIZE = 256
+
+# rows fetched at a time by iter_query
+FETCH_SIZE = 1000
+
+# the ResultCache in front of run_query, None until enable_cache is called
+result_cache = None
+
+# the QueryTracer timing run_query, None until enable_tracing is called
+query_tracer = None
 
 
 def run_query(db, q, args=None):
@@ -6,56 +116,133 @@ def run_query(db, q, args=None):
     Return the results of running query q with arguments args on
     database db."""
 
-    conn = sqlite3.connect(db)
-    cur = conn.cursor()
-    # execute the query with the given args passed
-    # if args is None, we have only a query
-    if args is None:
-        cur.execute(q)
-    else:
-        cur.execute(q, args)
+    if query_tracer is None:
+        return untraced_query(db, q, args)
+    return query_tracer.run(db, q, args, untraced_query)
+
+
+def untraced_query(db, q, args=None):
+    """(str, str, tuple) -> list of tuple
+    Run query q with arguments args on database db through the result
+    cache, without tracing it."""
+
+    # only reads can be answered from the cache
+    if result_cache is not None and q.lstrip()[:6].upper() == "SELECT":
+        return result_cache.run(db, q, args, fetch_query)
+    return fetch_query(db, q, args)
+
+
+def fetch_query(db, q, args=None):
+    """(str, str, tuple) -> list of tuple
+    Run query q with arguments args on database db, bypassing the
+    result cache."""
+
+    # borrow an already open connection instead of opening a new one
+    with get_pool(db).connection() as conn:
+        cur = conn.cursor()
+        # execute the query with the given args passed
+        # if args is None, we have only a query
+        if args is None:
+            cur.execute(q)
+        else:
+            cur.execute(q, args)
 
-    results = cur.fetchall()
-    cur.close()
-    conn.close()
+        results = cur.fetchall()
+        cur.close()
     return results
 
 
+def iter_query(db, q, args=None, size=None):
+    """(str, str, tuple) -> iterator of tuple
+    Yield the results of running query q with arguments args on database
+    db, fetching size rows, FETCH_SIZE by default, at a time so only one
+    batch is in memory. The rows bypass the result cache and the tracer.
+    The pooled connection is held until the iterator is exhausted or
+    closed."""
+
+    with get_pool(db).connection() as conn:
+        cur = conn.cursor()
+        if args is None:
+            cur.execute(q)
+        else:
+            cur.execute(q, args)
+        try:
+            while True:
+                rows = cur.fetchmany(size or FETCH_SIZE)
+                if not rows:
+                    break
+                for row in rows:
+                    yield row
+        except GeneratorExit:
+            # closed before the end, the connection is still good
+            pass
+        finally:
+            cur.close()
+
+
+def enable_cache(maxsize=None):
+    """Put a new ResultCache of maxsize results in front of run_query and
+    return it."""
+
+    global result_cache
+    result_cache = ResultCache(maxsize)
+    return result_cache
+
+
+def disable_cache():
+    """Stop caching results in run_query."""
+
+    global result_cache
+    if result_cache is not None:
+        result_cache.clear()
+    result_cache = None
+
+
+def enable_tracing(slow_ms=None, log=None, explain=False, hook=None):
+    """Time every run_query with a new QueryTracer and return it. Queries
+    over slow_ms milliseconds are written to log, a path or file; with
+    explain the plan of every distinct statement is captured."""
+
+    global query_tracer
+    disable_tracing()
+    query_tracer = QueryTracer(slow_ms, log, explain, hook)
+    return query_tracer
+
+
+def disable_tracing():
+    """Stop tracing run_query and close the tracer's slow log."""
+
+    global query_tracer
+    if query_tracer is not None:
+        query_tracer.close()
+    query_tracer = None
+
+
 def get_course_instructors(db, course):
     '''Return the Course number, sections
     and instructors for the given course number.'''
 
     # here a simple query is performed, we select three columns from the Course
     # table for a given course name
-    query = '''SELECT Course, Sections, '''
-    '''Name FROM Courses  WHERE Course = "%s"''' % course
-    return run_query(db, query)
+    return run_query(db, COURSE_INSTRUCTORS, (course,))
 
 
 def get_course_time(db, course):
     '''Return the course number, ID, the date and start time of the given
     course's exam for all sections. Note there are only multiple sections
     if the course IDs are different.'''
-    # to get course date and start time two tables, Courses and Time
-    # are joined together and filtered by the given course name
-    query = '''SELECT Courses.Course, Date, Start FROM Time INNER JOIN'''
-    '''Courses ON Courses.ID == Time.ID where Courses.Course = "%s"''' % course
-    return run_query(db, query)
+    # the date and start time are read from ExamSchedule, which already
+    # holds Courses joined with Time, by the given course name
+    return run_query(db, COURSE_TIME, (course,))
 
 
 def get_course_time_section(db, course, section):
     '''Return the course number, section,
     the date and start time of the given course's exam.'''
 
-    # we get date and start time
-    # for a given course and section by joining two tables
-    # Courses and Times
-    query = '''SELECT Course, Courses.ID, Date, Start FROM '''
-    '''Time INNER JOIN Courses ON Courses.ID == Time.ID where '''
-    '''Courses.Course = "%s" AND Courses.Sections = "%s"''' % (
-        course, section)
-
-    return run_query(db, query)
+    # we get date and start time for a given course and section from
+    # ExamSchedule, no join needed
+    return run_query(db, COURSE_TIME_SECTION, (course, section))
 
 
 def courses_multi_instructors(db):
@@ -63,11 +250,9 @@ def courses_multi_instructors(db):
     than one instructor. Note that this means the ID must be
     the same for each instructor.'''
 
-    # we select the Name rows containing comma
-    # because if there's a comma, there are more than one instructor
-    query = '''SELECT Course, Name from Courses WHERE NAME LIKE "%,%"'''
-
-    return run_query(db, query)
+    # the IDs with more than one instructor are counted in SQLite on the
+    # CourseInstructors index
+    return run_query(db, MULTI_INSTRUCTORS)
 
 
 def courses_how_many_instructors(db):
@@ -75,40 +260,44 @@ def courses_how_many_instructors(db):
     than one instructor. Note that this means the ID must be
     the same for each instructor.'''
 
-    # first we obtain all the courses with multiple instructors
-    res = courses_multi_instructors(db)
+    # the instructors are counted per ID by a GROUP BY on the
+    # CourseInstructors index, so no Name is split here
+    return [list(r) for r in run_query(db, COUNT_INSTRUCTORS)]
 
-    # an empty list for the result
-    count_instructors = []
 
-    # for every selected course we count the number
-    # of instructors by splitting the Name column by ","
-    # and calculating the resulting list length
-    for r in res:
-        count_instructors.append([r[0], len(r[1].split(','))])
+def find_dept_courses(db, dept):
 
-    return count_instructors
+    '''Return the courses from the given department, the courses whose
+    name starts with dept.'''
+    # we select a course departement by reading the range of course
+    # names starting with a given dept name from the index, rather than
+    # testing every course with LIKE
+    return run_query(db, DEPT_COURSES, prefix_range(dept))
 
 
-def find_dept_courses(db, dept):
+def count_dept_courses(db, dept):
+    '''Return the number of courses (one per section) from the given
+    department.'''
+
+    return run_query(db, DEPT_COUNT, prefix_range(dept))[0][0]
 
-    '''Return the courses from the given department.  Use  the "LIKE"
-    clause in your SQL query for the course name.'''
-    # we select a course departement by filtering all the course names
-    # starting with a given dept name
-    query = '''SELECT Course FROM Courses WHERE Course = LIKE "''' + dept + "%"
 
-    return run_query(db, query)
+def prefix_range(dept):
+    '''Return the (low, high) bounds of the course codes starting with
+    dept, which like course codes is matched in upper case.'''
+
+    low = dept.upper()
+    if not low:
+        return low, u"\uffff"
+    # the smallest string greater than every string starting with low
+    return low, low[:-1] + unichr(ord(low[-1]) + 1)
 
 
 def get_locations(db, course):
     '''Return the course, section and locations
     of the exam for the given course.'''
 
-    query = '''SELECT Courses.Course, Courses.Sections, '''
-    '''Locations.Room FROM Locations INNER JOIN Courses ON '''
-    '''Courses.ID == Locations.ID where Courses.Course = "%s"''' % course
-    return run_query(db, query)
+    return run_query(db, LOCATIONS, (course,))
 
 
 def check_conflicts(db, course):
@@ -116,46 +305,190 @@ def check_conflicts(db, course):
     that  have conflicts with the given course.
     A conflict is the same date and same start
     time. HINT: this may require more than one search.'''
-    # First we select all the courses
-    # with same date and start time
-    # after that we check if the given course is in the
-    # selected array
+    # the slots the course is in and the other courses in them are both
+    # found through an index on the precomputed ConflictSlots table
+
+    return run_query(db, CONFLICTS, (course,))
+
+
+def all_conflicts(db):
+    '''Return every conflict of the term as a list of (date, start,
+    sections) with the list of (course, section) pairs of at least two
+    different courses that have their exam on that date at that time.'''
+
+    report = []
+    for slot, rows in groupby(run_query(db, ALL_CONFLICTS), itemgetter(0)):
+        rows = list(rows)
+        report.append((rows[0][1], rows[0][2], [row[3:] for row in rows]))
+    return report
+
+
+def run_batch_query(db, q, keys, width=1, args=()):
+    '''Run batch statement q for every key in keys, BATCH_SIZE keys per
+    statement, binding args after the keys. Keys are tuples of width
+    values when width > 1. Return an OrderedDict from each key, in the
+    order given, to its rows without the key columns.'''
+
+    results = OrderedDict((key, []) for key in keys)
+    keys = list(results)
+    placeholder = "?" if width == 1 else "(%s)" % ", ".join("?" * width)
+
+    for start in range(0, len(keys), BATCH_SIZE):
+        chunk = keys[start:start + BATCH_SIZE]
+        # repeat the last key up to the next power of two, the IN list
+        # ignores the duplicates
+        size = 1
+        while size < len(chunk):
+            size *= 2
+        chunk += chunk[-1:] * (size - len(chunk))
+
+        values = chunk if width == 1 else [v for key in chunk for v in key]
+        query = q % ", ".join([placeholder] * size)
+        for row in run_query(db, query, values + list(args)):
+            key = row[0] if width == 1 else tuple(row[:width])
+            results[key].append(row[width:])
+    return results
+
+
+def get_course_instructors_batch(db, courses):
+    '''Return get_course_instructors for every course in courses, as an
+    OrderedDict from course to its rows, in one query per BATCH_SIZE
+    courses.'''
+
+    return run_batch_query(db, COURSE_INSTRUCTORS_BATCH, courses)
+
+
+def get_course_time_batch(db, courses):
+    '''Return get_course_time for every course in courses, as an
+    OrderedDict from course to its rows, in one query per BATCH_SIZE
+    courses.'''
+
+    return run_batch_query(db, COURSE_TIME_BATCH, courses)
+
+
+def get_course_time_section_batch(db, sections):
+    '''Return get_course_time_section for every (course, section) pair
+    in sections, as an OrderedDict from pair to its rows, in one query
+    per BATCH_SIZE pairs.'''
+
+    return run_batch_query(
+        db, COURSE_TIME_SECTION_BATCH, [tuple(s) for s in sections], width=2)
+
+
+def get_locations_batch(db, courses):
+    '''Return get_locations for every course in courses, as an
+    OrderedDict from course to its rows, in one query per BATCH_SIZE
+    courses.'''
+
+    return run_batch_query(db, LOCATIONS_BATCH, courses)
+
+
+def exams_between(db, start, end):
+    '''Return the (course, section, date, start, end, room) of every exam
+    starting at or after start and before end, datetimes on the wall
+    clock of the catalog, in order of start time.'''
+
+    return run_query(db, EXAMS_BETWEEN, (to_minutes(start), to_minutes(end)))
+
+
+def exams_on(db, day):
+    '''Return exams_between for the exams starting on date day.'''
+
+    start = to_minutes(day)
+    return run_query(db, EXAMS_BETWEEN, (start, start + 1440))
+
+
+def next_exams(db, courses, now=None):
+    '''Return an OrderedDict from each course in courses to the (section,
+    date, start, room) of its first exam starting at or after now, the
+    current time by default, or to None if it has none left.'''
+
+    if now is None:
+        now = datetime.now()
+    results = run_batch_query(
+        db, NEXT_EXAM_BATCH, courses, args=(to_minutes(now),))
+    for course, rows in results.items():
+        results[course] = rows[0][:-1] if rows else None
+    return results
+
 
-    query = '''SELECT Course FROM Courses WHERE Course '''
-    '''IN (SELECT Course FROM Time INNER JOIN Courses '''
-    '''ON Courses.ID == Time.ID GROUP BY Time.Date,Time.Start'''
-    '''HAVING count(*) > 1) AND Courses.Course = "%s"''' % course
-    return run_query(db, query)
+class ExamLookupError(LookupError):
+    """The exam of a course could not be told apart or found."""
 
+    reason = "no exam found"
 
-def get_exam_info(db, course, sec=None):
+
+class UnknownCourse(ExamLookupError):
+    """There is no exam for the course, the suggestions attribute lists
+    the closest valid course codes."""
+
+    reason = "not a valid course code"
+
+    def __init__(self, course, suggestions=()):
+        ExamLookupError.__init__(self, course)
+        self.suggestions = list(suggestions)
+
+
+class UnknownSection(ExamLookupError):
+    """The course has no exam for the section."""
+
+    reason = "not a valid section code"
+
+
+class SectionRequired(ExamLookupError):
+    """The course has several sections, the sections attribute lists
+    them."""
+
+    reason = "course has several sections, add a section"
+
+    def __init__(self, course, sections):
+        ExamLookupError.__init__(self, course)
+        self.sections = sections
+
+
+class InvalidEntry(ExamLookupError):
+    """A batch line is not valid UTF-8."""
+
+    reason = "not valid UTF-8"
+
+
+class LookupFailed(ExamLookupError):
+    """Looking up the exam raised an error, given as the reason."""
+
+    def __init__(self, course, error):
+        ExamLookupError.__init__(self, course)
+        self.reason = "lookup failed: %s" % error
+
+
+def find_exam(db, course, sec=None, engine=None):
     """
-    Gets exam info on given course name. If a course have multiple sections,
-    user can enter a section name
+    Return the exam info of the given course name, or of section sec if
+    the course has several sections, as a dict of course, section, date
+    and time. Raise UnknownCourse, SectionRequired or UnknownSection
+    instead of asking again. The lookups go through engine, a module with
+    the same get_course_time, get_course_time_section and
+    get_course_instructors functions as this one such as snapshot, or to
+    the database if engine is None.
     """
 
-    res = get_course_time(db, course)
+    if engine is None:
+        engine = sys.modules[__name__]
+
+    res = engine.get_course_time(db, course)
 
     # res has multiple sections
     if len(res) > 1:
-        if not sec:
-            sec = raw_input(
-                "There are multiple sections"
-                "of Course %s. What is your section?" % course)
-        res = get_course_time_section(db, course, sec)
+        if sec is None:
+            raise SectionRequired(course, sorted(set(
+                row[1] for row in engine.get_course_instructors(db, course))))
+        res = engine.get_course_time_section(db, course, sec)
         if len(res) == 0:
-            sec = raw_input(
-                "Not a valid section code, please re-enter or return to quit.")
-            if not sec:
-                raise SystemExit
-            return get_exam_info(db, course, sec=sec)
+            raise UnknownSection(course, sec)
+        # the section rows also carry the ID before the date and time
+        res = [row[:1] + row[2:] for row in res]
 
     elif len(res) == 0:
-        course = raw_input(
-            "Not a valid course code, please re-enter or return to quit.")
-        if not course:
-            raise SystemExit
-        return get_exam_info(db, course)
+        raise UnknownCourse(course, suggest(db, course))
 
     return {
         "course": res[0][0],
@@ -165,6 +498,199 @@ def get_exam_info(db, course, sec=None):
         }
 
 
+def find_exams(db, entries, engine=None):
+    """
+    Return find_exam of every (course, section) pair in entries, section
+    being None when not given, as a list in the same order holding either
+    the exam dict or the ExamLookupError find_exam would raise. The
+    entries are resolved with one query per BATCH_SIZE courses, or one
+    find_exam each when going through engine.
+    """
+
+    if engine is not None:
+        results = []
+        for course, sec in entries:
+            try:
+                results.append(find_exam(db, course, sec, engine))
+            except ExamLookupError as error:
+                results.append(error)
+        return results
+
+    # the (section, date, start) of every exam of each course
+    exams = run_batch_query(
+        db, EXAM_BATCH, sorted(set(course for course, sec in entries)))
+
+    results = []
+    for course, sec in entries:
+        rows = exams.get(course)
+        if not rows:
+            results.append(UnknownCourse(course, suggest(db, course)))
+        elif len(rows) == 1:
+            results.append({
+                "course": course, "section": sec,
+                "date": rows[0][1], "time": rows[0][2]})
+        elif sec is None:
+            results.append(SectionRequired(
+                course, sorted(set(row[0] for row in rows))))
+        else:
+            rows = [row for row in rows if row[0] == sec]
+            if rows:
+                results.append({
+                    "course": course, "section": sec,
+                    "date": rows[0][1], "time": rows[0][2]})
+            else:
+                results.append(UnknownSection(course, sec))
+    return results
+
+
+def parse_entry(line):
+    """Return the (course, section) of a course[/section] line as
+    unicode, section being None when not given. Raise InvalidEntry if
+    line is bytes that are not UTF-8."""
+
+    if isinstance(line, str):
+        try:
+            line = line.decode("utf-8")
+        except UnicodeDecodeError:
+            raise InvalidEntry(line.strip().decode("utf-8", "replace"))
+    course, _, sec = line.strip().partition("/")
+    return course.strip(), sec.strip() or None
+
+
+def resolve_entries(db, lines, engine=None):
+    """Return the (entry, result) of every line of lines, entry being
+    its (course, section) and result what find_exams gives for it. A
+    line that cannot be parsed, or whose lookup raises, gets an
+    ExamLookupError result instead of stopping the others."""
+
+    entries = []
+    results = {}
+    for i, line in enumerate(lines):
+        try:
+            entries.append(parse_entry(line))
+        except InvalidEntry as error:
+            entries.append((error.args[0], None))
+            results[i] = error
+    valid = [i for i in range(len(entries)) if i not in results]
+    try:
+        found = find_exams(db, [entries[i] for i in valid], engine)
+    except Exception:
+        # find out which entries fail, one at a time
+        found = []
+        for i in valid:
+            try:
+                found.append(find_exam(db, entries[i][0], entries[i][1],
+                                       engine))
+            except ExamLookupError as error:
+                found.append(error)
+            except Exception as error:
+                found.append(LookupFailed(entries[i][0], error))
+    results.update(zip(valid, found))
+    return [(entry, results[i]) for i, entry in enumerate(entries)]
+
+
+def encode(value):
+    """Return unicode value as UTF-8 for the csv module, anything else
+    as it is."""
+
+    if isinstance(value, unicode):
+        return value.encode("utf-8")
+    return value
+
+
+# columns written by write_exams
+EXAM_FIELDS = ("course", "section", "date", "time", "error")
+
+
+def exam_row(entry, result):
+    """Return the dict of EXAM_FIELDS written for the (course, section)
+    entry and its find_exams result."""
+
+    if not isinstance(result, ExamLookupError):
+        return dict(result, error=None)
+    row = {"course": entry[0], "section": entry[1], "date": None,
+           "time": None, "error": result.reason}
+    if isinstance(result, SectionRequired):
+        row["sections"] = result.sections
+    elif isinstance(result, UnknownCourse) and result.suggestions:
+        row["suggestions"] = result.suggestions
+    return row
+
+
+def write_exams(db, lines, out, fmt="csv", engine=None,
+                chunk_size=10000):
+    """
+    Look up the exam of every course[/section] in lines and write one
+    row per line to out, as CSV with a header or as JSON lines. Blank
+    lines are skipped; a line that cannot be read or resolved gets its
+    error in the error column instead of stopping the run. Return the
+    number of lines written and of those with an error.
+    """
+
+    if fmt == "csv":
+        writer = csv.writer(out)
+        writer.writerow(EXAM_FIELDS)
+    written = failed = 0
+    lines = (line for line in lines if line.strip())
+    while True:
+        chunk = list(islice(lines, chunk_size))
+        if not chunk:
+            break
+        for entry, result in resolve_entries(db, chunk, engine):
+            row = exam_row(entry, result)
+            if fmt == "csv":
+                error = row["error"]
+                if "sections" in row:
+                    error += ": " + " ".join(row["sections"])
+                elif "suggestions" in row:
+                    error += ", did you mean: " + " ".join(
+                        row["suggestions"])
+                writer.writerow([
+                    encode(row[field] if field != "error" else error)
+                    for field in EXAM_FIELDS])
+            else:
+                out.write(json.dumps(row, sort_keys=True) + "\n")
+            written += 1
+            failed += row["error"] is not None
+    return written, failed
+
+
+def get_exam_info(db, course, sec=None, engine=None):
+    """
+    Gets exam info on given course name. If a course have multiple sections,
+    user can enter a section name. The lookups go through engine as in
+    find_exam.
+    """
+
+    sec = sec or None
+    while True:
+        try:
+            return find_exam(db, course, sec, engine)
+        except SectionRequired:
+            sec = raw_input(
+                "There are multiple sections"
+                "of Course %s. What is your section?" % course)
+        except UnknownSection:
+            sec = raw_input(
+                "Not a valid section code, "
+                "please re-enter or return to quit.")
+            if not sec:
+                raise SystemExit
+        except UnknownCourse as error:
+            if error.suggestions:
+                course = raw_input(
+                    "Not a valid course code, did you mean %s? Please "
+                    "re-enter or return to quit." % ", ".join(
+                        error.suggestions))
+            else:
+                course = raw_input(
+                    "Not a valid course code, please re-enter or return "
+                    "to quit.")
+            if not course:
+                raise SystemExit
+            sec = None
+
+
 def print_exam_info(res):
     """ Prints formatted information on course exams """
     # checking if section info is filled
@@ -178,11 +704,11 @@ def print_exam_info(res):
             )
 
 
-def exam_info(db, course):
+def exam_info(db, course, engine=None):
     """ A simple wrapper for duplicated code """
 
     # obtaining exam info for a given course
-    res = get_exam_info(db, course)
+    res = get_exam_info(db, course, engine=engine)
 
     # printing exam info
     print_exam_info(res)
@@ -194,12 +720,37 @@ if __name__ == '__main__':
     # DO NOT CHANGE THIS LINE
     db = 'exams.db'
 
+    parser = argparse.ArgumentParser(description="Look up exams")
+    # with --snapshot the tables are read into memory once and every
+    # lookup is answered from there
+    parser.add_argument("--snapshot", action="store_true")
+    parser.add_argument(
+        "--batch", nargs="?", const="-", metavar="FILE",
+        help="look up every course[/section] line of FILE, or of stdin, "
+        "and write the results to stdout without prompting")
+    parser.add_argument(
+        "--format", choices=("csv", "json"), default="csv",
+        help="write the batch results as CSV or as JSON lines")
+    options = parser.parse_args()
+    engine = snapshot if options.snapshot else None
+    # a lookup file built from the current database answers without
+    # opening it
+    if engine is None and lookupfile.available(db):
+        engine = lookupfile
+
+    if options.batch is not None:
+        lines = sys.stdin if options.batch == "-" else open(options.batch)
+        written, failed = write_exams(
+            db, lines, sys.stdout, options.format, engine)
+        sys.stderr.write("%d looked up, %d not found\n" % (written, failed))
+        raise SystemExit
+
     # add the rest of your code here
     # obtaining course name from user input
     user_course = raw_input("Please enter your course or return to quit.")
 
     # call the wrapping function for fetching and printing the result
-    exam_info(db, user_course)
+    exam_info(db, user_course, engine)
 
     # if course name is not defined, exit
     if not user_course:
@@ -218,4 +769,4 @@ if __name__ == '__main__':
                 raise SystemExit
 
             # another call for the wrapping function
-            exam_info(db, user_course)
+            exam_info(db, user_course, engine)
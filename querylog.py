@@ -0,0 +1,119 @@
+# record the statements run_query runs, log the slow ones
+
+import json
+import sys
+import threading
+import time
+import timeit
+from collections import deque, namedtuple
+
+# statements taking longer than this many milliseconds are logged
+SLOW_MS = 100
+
+# number of recent queries kept in QueryTracer.records
+KEEP = 1000
+
+# functions that only pass a statement on, the caller recorded is the
+# function that called them
+PASS_THROUGH = frozenset(['run_query', 'run_batch_query'])
+
+QueryRecord = namedtuple(
+    'QueryRecord', 'time db statement args seconds rows caller error')
+
+
+def caller_name(frame):
+    '''Return the module.function name of the code that ran the query
+    from frame on, skipping the PASS_THROUGH functions.'''
+
+    while frame is not None and frame.f_code.co_name in PASS_THROUGH:
+        frame = frame.f_back
+    if frame is None:
+        return None
+    return '%s.%s' % (frame.f_globals.get('__name__'), frame.f_code.co_name)
+
+
+class QueryTracer(object):
+    '''Time every statement run through run_query. The last keep queries
+    are kept in records as QueryRecords, hook is called with each one,
+    and the ones taking over slow_ms milliseconds are written to log, a
+    path or file, as JSON lines. With explain, the EXPLAIN QUERY PLAN of
+    each distinct statement is captured in plans the first time it runs
+    and added to its slow log entries.'''
+
+    def __init__(self, slow_ms=None, log=None, explain=False, hook=None,
+                 keep=None):
+        self.slow = (SLOW_MS if slow_ms is None else slow_ms) / 1000.0
+        self.explain = explain
+        self.hook = hook
+        self.records = deque(maxlen=KEEP if keep is None else keep)
+        self.plans = {}
+        self._lock = threading.Lock()
+        self._owns_log = isinstance(log, basestring)
+        self.log = open(log, 'a') if self._owns_log else log
+
+    def run(self, db, q, args, fetch):
+        '''Return fetch(db, q, args), recording how long it took, how many
+        rows it returned and which function asked for it.'''
+
+        if self.explain and (db, q) not in self.plans:
+            self.capture_plan(db, q, args, fetch)
+
+        error = None
+        start = timeit.default_timer()
+        try:
+            results = fetch(db, q, args)
+        except BaseException as e:
+            error = '%s: %s' % (type(e).__name__, e)
+            raise
+        finally:
+            seconds = timeit.default_timer() - start
+            self.record(QueryRecord(
+                time.time(), db, q, args, seconds,
+                None if error else len(results),
+                caller_name(sys._getframe(1)), error))
+        return results
+
+    def capture_plan(self, db, q, args, fetch):
+        '''Remember the EXPLAIN QUERY PLAN of q as a list of its detail
+        lines, or the error explaining it raised.'''
+
+        # only statements reading data have a plan worth keeping, and
+        # explaining anything else must not run it twice
+        try:
+            if q.split(None, 1)[0].upper() in ('SELECT', 'WITH'):
+                plan = [row[-1] for row in fetch(
+                    db, 'EXPLAIN QUERY PLAN ' + q, args)]
+            else:
+                plan = None
+        except Exception as e:
+            plan = ['%s: %s' % (type(e).__name__, e)]
+        with self._lock:
+            self.plans[(db, q)] = plan
+
+    def record(self, entry):
+        '''Keep entry, pass it to the hook and log it if it is slow.'''
+
+        self.records.append(entry)
+        if self.hook is not None:
+            self.hook(entry)
+        if self.log is not None and entry.seconds >= self.slow:
+            line = entry._asdict()
+            line['args'] = None if entry.args is None else list(entry.args)
+            line['plan'] = self.plans.get((entry.db, entry.statement))
+            line = json.dumps(line, default=repr)
+            with self._lock:
+                self.log.write(line + '\n')
+                self.log.flush()
+
+    def slowest(self, n=10):
+        '''Return the n slowest of the recent records, slowest first.'''
+
+        return sorted(
+            self.records, key=lambda entry: entry.seconds, reverse=True)[:n]
+
+    def close(self):
+        '''Close the slow log if it was opened from a path.'''
+
+        if self._owns_log:
+            self.log.close()
+        self.log = None
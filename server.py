@@ -0,0 +1,197 @@
+# serve the exam lookups as JSON over HTTP
+
+import argparse
+import json
+import urlparse
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+
+import queries
+import snapshot
+from suggest import suggest
+
+
+def exam(server, params):
+    '''GET /exam?course=C[&section=S]: the exam of a course, as printed by
+    the interactive lookup.'''
+
+    try:
+        return 200, queries.find_exam(
+            server.db, params["course"], params.get("section"), server.engine)
+    except queries.SectionRequired as error:
+        return 400, {
+            "error": error.reason, "course": params["course"],
+            "sections": error.sections}
+    except queries.UnknownSection as error:
+        return 404, {
+            "error": error.reason, "course": params["course"],
+            "section": params["section"]}
+    except queries.UnknownCourse as error:
+        return 404, {
+            "error": error.reason, "course": params["course"],
+            "suggestions": error.suggestions}
+
+
+def rows_or_404(rows, fields, params, server=None):
+    '''Return rows as a list of dicts of fields, or a 404 if it is empty,
+    with the course codes of server's database closest to the course if
+    server is given.'''
+
+    if not rows:
+        body = {"error": "no such course", "course": params["course"]}
+        if server is not None:
+            body["suggestions"] = suggest(server.db, params["course"])
+        return 404, body
+    return 200, [dict(zip(fields, row)) for row in rows]
+
+
+def course_time(server, params):
+    '''GET /time?course=C: the exam date and start of every section.'''
+
+    return rows_or_404(
+        server.engine.get_course_time(server.db, params["course"]),
+        ("course", "date", "time"), params, server)
+
+
+def course_time_section(server, params):
+    '''GET /section?course=C&section=S: the exam of one section.'''
+
+    rows = server.engine.get_course_time_section(
+        server.db, params["course"], params["section"])
+    if not rows and server.engine.get_course_time(
+            server.db, params["course"]):
+        # the course is there, the section is not
+        return 404, {
+            "error": queries.UnknownSection.reason,
+            "course": params["course"], "section": params["section"]}
+    return rows_or_404(
+        rows, ("course", "id", "date", "time"), params, server)
+
+
+def locations(server, params):
+    '''GET /locations?course=C: the exam room of every section.'''
+
+    return rows_or_404(
+        server.engine.get_locations(server.db, params["course"]),
+        ("course", "section", "room"), params, server)
+
+
+def conflicts(server, params):
+    '''GET /conflicts?course=C: the courses with an exam at the same date
+    and start time, an empty list if there are none.'''
+
+    rows = queries.check_conflicts(server.db, params["course"])
+    return 200, [row[0] for row in rows]
+
+
+# path -> (handler, required parameters)
+ROUTES = {
+    "/exam": (exam, ("course",)),
+    "/time": (course_time, ("course",)),
+    "/section": (course_time_section, ("course", "section")),
+    "/locations": (locations, ("course",)),
+    "/conflicts": (conflicts, ("course",)),
+    }
+
+
+class ExamRequestHandler(BaseHTTPRequestHandler):
+    '''Answer GET requests on the ROUTES with JSON.'''
+
+    # HTTP/1.1 keeps the connection open between requests
+    protocol_version = "HTTP/1.1"
+    # send the status, headers and body in one write; written piecemeal,
+    # each kept-alive response waits out the client's delayed ACK
+    wbufsize = -1
+
+    def do_GET(self):
+        url = urlparse.urlparse(self.path)
+        route = ROUTES.get(url.path)
+        if route is None:
+            self.send_json(404, {"error": "unknown path", "path": url.path})
+            return
+        handler, required = route
+
+        try:
+            params = dict(
+                (name, value.decode("utf-8"))
+                for name, value in urlparse.parse_qsl(url.query))
+        except UnicodeDecodeError:
+            self.send_json(400, {"error": "parameters are not valid UTF-8"})
+            return
+        missing = [name for name in required if not params.get(name)]
+        if missing:
+            self.send_json(
+                400, {"error": "missing parameter", "missing": missing})
+            return
+
+        try:
+            status, body = handler(self.server, params)
+        except Exception as error:
+            # answer rather than drop the connection, and keep the
+            # details in the log
+            self.log_error("%s failed: %r", url.path, error)
+            status, body = 500, {
+                "error": "internal error", "detail": "%s: %s" % (
+                    type(error).__name__, error)}
+        self.send_json(status, body)
+
+    def send_json(self, status, body):
+        data = json.dumps(body)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+
+class ExamServer(ThreadingMixIn, HTTPServer):
+    '''A threaded HTTP server answering exam lookups on database db. The
+    lookups go through engine as in queries.find_exam; every thread
+    borrows from the same pool of open connections.'''
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, db, engine=None, quiet=False):
+        HTTPServer.__init__(self, address, ExamRequestHandler)
+        self.db = db
+        self.engine = queries if engine is None else engine
+        self.quiet = quiet
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve exams.db as JSON")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--db", default="exams.db")
+    parser.add_argument(
+        "--snapshot", action="store_true",
+        help="answer from an in-memory copy of the database")
+    parser.add_argument(
+        "--quiet", action="store_true", help="do not log every request")
+    parser.add_argument(
+        "--slow-log", help="append the queries slower than --slow-ms here")
+    parser.add_argument("--slow-ms", type=float)
+    parser.add_argument(
+        "--explain", action="store_true",
+        help="add the query plan to the slow log entries")
+    options = parser.parse_args()
+
+    if options.slow_log:
+        queries.enable_tracing(
+            options.slow_ms, options.slow_log, options.explain)
+
+    server = ExamServer(
+        (options.host, options.port), options.db,
+        snapshot if options.snapshot else None, options.quiet)
+    print "Serving %s on http://%s:%d/" % (
+        options.db, options.host, options.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
@@ -0,0 +1,166 @@
+# an in-memory copy of exams.db for read-only lookups
+
+import os
+import sqlite3
+import threading
+import time
+
+# seconds between checks of whether the database file has changed
+CHECK_INTERVAL = 1.0
+
+
+class Snapshot(object):
+    '''The Courses, Time and Locations tables of one database held in
+    dicts keyed on course, (course, section) and ID. The lookups return
+    the same tuples as the functions of the same name in queries.py.'''
+
+    def __init__(self, db, check_interval=None):
+        self.db = db
+        if check_interval is None:
+            check_interval = CHECK_INTERVAL
+        self.check_interval = check_interval
+        self.loads = 0
+        self._conn = None
+        self._file = None
+        self._version = None
+        self._checked = 0
+        self._lock = threading.Lock()
+        with self._lock:
+            self._load()
+
+    def _stat(self):
+        st = os.stat(self.db)
+        return (st.st_dev, st.st_ino), (st.st_size, st.st_mtime)
+
+    def _data_version(self):
+        return self._conn.execute('PRAGMA data_version').fetchone()[0]
+
+    def _load(self):
+        '''Read the three tables into fresh indexes and swap them in.'''
+
+        ident, stamp = self._stat()
+        if self._conn is None or ident != self._file:
+            # the file was replaced, the old connection still sees the
+            # old one
+            if self._conn is not None:
+                self._conn.close()
+            self._conn = sqlite3.connect(self.db, check_same_thread=False)
+            self._file = ident
+
+        by_id = {}
+        by_course = {}
+        by_section = {}
+        times = {}
+        rooms = {}
+        # read everything in one transaction so the tables match
+        with self._conn:
+            self._conn.execute('BEGIN')
+            for ID, course, section, name in self._conn.execute(
+                    '''SELECT ID, Course, Sections, Name FROM Courses'''):
+                by_id[ID] = (course, section, name)
+                by_course.setdefault(course, []).append(ID)
+                by_section.setdefault((course, section), []).append(ID)
+            for row in self._conn.execute(
+                    '''SELECT ID, Date, Start, End, Duration FROM Time'''):
+                times[row[0]] = row[1:]
+            for ID, room in self._conn.execute(
+                    '''SELECT ID, Room FROM Locations'''):
+                rooms[ID] = room
+            version = self._data_version()
+
+        self._tables = (by_id, by_course, by_section, times, rooms)
+        self._version = (version, stamp)
+        self._checked = time.time()
+        self.loads += 1
+
+    def refresh(self, force=False):
+        '''Reload the tables if the database changed since they were read,
+        or always if force is True. Return True if they were reloaded.'''
+
+        with self._lock:
+            self._checked = time.time()
+            ident, stamp = self._stat()
+            if (force or ident != self._file or
+                    (self._data_version(), stamp) != self._version):
+                self._load()
+                return True
+        return False
+
+    def _current(self):
+        if time.time() - self._checked >= self.check_interval:
+            self.refresh()
+        return self._tables
+
+    def get_course_instructors(self, course):
+        '''Return the course, sections and instructors of course.'''
+
+        by_id, by_course = self._current()[:2]
+        return [by_id[ID] for ID in by_course.get(course, ())]
+
+    def get_course_time(self, course):
+        '''Return the course, date and start time of each section of
+        course that has an exam.'''
+
+        by_id, by_course, by_section, times = self._current()[:4]
+        return [
+            by_id[ID][:1] + times[ID][:2]
+            for ID in by_course.get(course, ()) if ID in times]
+
+    def get_course_time_section(self, course, section):
+        '''Return the course, ID, date and start time of the exam of the
+        given section of course.'''
+
+        by_id, by_course, by_section, times = self._current()[:4]
+        return [
+            by_id[ID][:1] + (ID,) + times[ID][:2]
+            for ID in by_section.get((course, section), ()) if ID in times]
+
+    def get_locations(self, course):
+        '''Return the course, section and room of each section of course
+        that has a location.'''
+
+        by_id, by_course, by_section, times, rooms = self._current()
+        return [
+            by_id[ID][:2] + (rooms[ID],)
+            for ID in by_course.get(course, ()) if ID in rooms]
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+_snapshots = {}
+_snapshots_lock = threading.Lock()
+
+
+def get_snapshot(db):
+    '''Return the shared snapshot of database db, loading it if needed.'''
+
+    snapshot = _snapshots.get(db)
+    if snapshot is None:
+        with _snapshots_lock:
+            snapshot = _snapshots.get(db)
+            if snapshot is None:
+                snapshot = _snapshots[db] = Snapshot(db)
+    return snapshot
+
+
+# the same signatures as in queries.py, so this module can stand in for it
+
+
+def get_course_instructors(db, course):
+    return get_snapshot(db).get_course_instructors(course)
+
+
+def get_course_time(db, course):
+    return get_snapshot(db).get_course_time(course)
+
+
+def get_course_time_section(db, course, section):
+    return get_snapshot(db).get_course_time_section(course, section)
+
+
+def get_locations(db, course):
+    return get_snapshot(db).get_locations(course)
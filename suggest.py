@@ -0,0 +1,225 @@
+# suggest valid course codes close to a mistyped one
+
+import os
+import threading
+from bisect import bisect_left
+
+from pool import get_pool
+
+# number of suggestions returned
+SUGGESTIONS = 5
+
+# codes further than this many edits from the text are not suggested,
+# unless they start with it
+MAX_DISTANCE = 2
+
+COURSES = '''SELECT DISTINCT Course FROM Courses'''
+
+
+def normalize(text):
+    '''Return text upper cased and without whitespace, as unicode.'''
+
+    if isinstance(text, str):
+        text = text.decode('utf-8', 'replace')
+    return u''.join(text.split()).upper()
+
+
+def edit_distance(a, b):
+    '''Return the number of insertions, deletions, substitutions and
+    swaps of adjacent characters turning a into b.'''
+
+    previous = None
+    row = range(len(b) + 1)
+    for i in range(1, len(a) + 1):
+        before, previous = previous, row
+        row = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            row[j] = min(
+                previous[j] + 1, row[j - 1] + 1, previous[j - 1] + cost)
+            if (i > 1 and j > 1 and a[i - 1] == b[j - 2] and
+                    a[i - 2] == b[j - 1]):
+                row[j] = min(row[j], before[j - 2] + 1)
+    return row[-1]
+
+
+class SuggestionIndex(object):
+    '''The course codes of a catalog, indexed to find the ones closest to
+    a mistyped code by edit distance. Every string one edit away from the
+    text is looked up in a set of the codes and codes starting with the
+    text are read from a sorted list. When that finds too few, the sorted
+    list is walked as a trie, keeping the edit distance of the text to
+    each prefix: branches already more than MAX_DISTANCE edits away are
+    left, and once a prefix has spent every edit the few codes it can
+    still end in are looked up in the set instead.'''
+
+    def __init__(self, codes):
+        # the codes by their normalized form, only kept for those that
+        # differ from it
+        self._original = {}
+        keys = set()
+        for code in codes:
+            key = normalize(code)
+            keys.add(key)
+            if key != code:
+                self._original[key] = code
+        self._keys = frozenset(keys)
+        self._sorted = sorted(keys)
+        self.alphabet = u''.join(sorted(set(u''.join(keys))))
+
+    @classmethod
+    def from_db(cls, db):
+        '''Index the course codes of the Courses table of db.'''
+
+        with get_pool(db).connection() as conn:
+            return cls(row[0] for row in conn.execute(COURSES) if row[0])
+
+    def __len__(self):
+        return len(self._keys)
+
+    def edits(self, key):
+        '''Return the set of strings one edit away from key, using only
+        the characters found in the codes.'''
+
+        alphabet = self.alphabet
+        splits = [(key[:i], key[i:]) for i in range(len(key) + 1)]
+        edits = set(left + c + right for left, right in splits
+                    for c in alphabet)
+        edits.update(left + right[1:] for left, right in splits if right)
+        edits.update(left + c + right[1:] for left, right in splits
+                     if right for c in alphabet)
+        edits.update(left + right[1] + right[0] + right[2:]
+                     for left, right in splits if len(right) > 1)
+        return edits
+
+    def within(self, key, distance=MAX_DISTANCE):
+        '''Return a dict of the codes at most distance edits away from
+        key, as edit_distance counts them, to their distance.'''
+
+        codes = self._sorted
+        size = len(key)
+        # distances past the limit are all kept as far, they only need to
+        # be known as too far
+        far = distance + 1
+        found = {}
+        # (prefix, its codes codes[lo:hi], the edit distances of key[:i]
+        # to the prefix, and to the prefix without its last character)
+        stack = [(u'', 0, len(codes), [min(i, far) for i in range(size + 1)],
+                  None)]
+        while stack:
+            prefix, lo, hi, row, before = stack.pop()
+            if min(row) >= distance:
+                # no edit left to spend: the code can only go on with the
+                # rest of key, or swap the last character with the next
+                rests = [
+                    key[i:] for i in range(size + 1) if row[i] <= distance]
+                if before is not None:
+                    rests.extend(
+                        key[i - 2] + key[i:] for i in range(2, size + 1)
+                        if key[i - 1] == prefix[-1] and
+                        before[i - 2] < distance)
+                for code in set(prefix + rest for rest in rests):
+                    if code in self._keys:
+                        found[code] = edit_distance(key, code)
+                continue
+            depth = len(prefix)
+            if len(codes[lo]) == depth:
+                # the prefix is a code itself
+                if row[-1] <= distance:
+                    found[prefix] = row[-1]
+                lo += 1
+            # only the cells this close to the diagonal can be near enough
+            first = max(depth + 1 - distance, 1)
+            last = min(depth + 1 + distance, size)
+            while lo < hi:
+                c = codes[lo][depth]
+                end = bisect_left(codes, prefix + unichr(ord(c) + 1), lo, hi)
+                next_row = [far] * (size + 1)
+                next_row[0] = best = min(depth + 1, far)
+                for i in range(first, last + 1):
+                    value = row[i - 1] + (key[i - 1] != c)
+                    if row[i] < value:
+                        value = row[i] + 1
+                    if next_row[i - 1] < value:
+                        value = next_row[i - 1] + 1
+                    if (before is not None and i > 1 and key[i - 2] == c and
+                            key[i - 1] == prefix[-1] and
+                            before[i - 2] < value):
+                        value = before[i - 2] + 1
+                    if value > far:
+                        value = far
+                    next_row[i] = value
+                    if value < best:
+                        best = value
+                # a branch too far already is only kept if swapping c with
+                # the next character of the code can bring it back
+                if best <= distance or any(
+                        key[i] == c and row[i - 1] < distance
+                        for i in range(1, size)):
+                    stack.append((prefix + c, lo, end, next_row, row))
+                lo = end
+        return found
+
+    def suggest(self, text, limit=None):
+        '''Return up to limit, SUGGESTIONS by default, course codes
+        closest to text by edit distance, the nearest first: those at most
+        MAX_DISTANCE edits away or starting with text. text itself is
+        left out.'''
+
+        if limit is None:
+            limit = SUGGESTIONS
+        key = normalize(text)
+        if not key or not self._keys:
+            return []
+
+        ranked = dict.fromkeys(self._keys & self.edits(key), 1)
+        if key in self._keys:
+            ranked[key] = 0
+        if len(ranked) - (key in ranked) < limit:
+            # too few codes one edit away, add those further
+            ranked.update(self.within(key))
+        # a code with its suffix left off, such as CSC108 for CSC108H1F
+        i = bisect_left(self._sorted, key)
+        for code in self._sorted[i:i + limit]:
+            if not code.startswith(key):
+                break
+            ranked.setdefault(code, len(code) - len(key))
+
+        # among codes as far away, a swap of two letters is the likeliest
+        # typo, then the code sharing the longest start with the text
+        letters = sorted(key)
+
+        def rank(code):
+            return (ranked[code], sorted(code) != letters,
+                    -len(os.path.commonprefix((key, code))), code)
+
+        codes = [self._original.get(code, code)
+                 for code in sorted(ranked, key=rank)]
+        return [code for code in codes if code != text][:limit]
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(db):
+    '''Return the shared SuggestionIndex of database db, building it again
+    if the file changed since it was built.'''
+
+    st = os.stat(db)
+    identity = (st.st_dev, st.st_ino, st.st_size, st.st_mtime)
+    index = _indexes.get(db)
+    if index is None or index[0] != identity:
+        with _indexes_lock:
+            index = _indexes.get(db)
+            if index is None or index[0] != identity:
+                index = _indexes[db] = (
+                    identity, SuggestionIndex.from_db(db))
+    return index[1]
+
+
+def suggest(db, course, limit=None):
+    '''Return the course codes of db closest to course, as
+    SuggestionIndex.suggest.'''
+
+    return get_index(db).suggest(course, limit)
@@ -0,0 +1,133 @@
+# write a synthetic catalog of any size in the formats make_tables reads
+
+import argparse
+import csv
+import os
+import random
+from datetime import date, timedelta
+
+# last names the instructors are drawn from
+INSTRUCTORS = (
+    'Brown', 'Chen', 'Garcia', 'Jones', 'Khan', 'Lee', 'Martin', 'Nguyen',
+    'Patel', 'Singh', 'Smith', 'Taylor', 'Wang', 'Williams', 'Wilson',
+    'Zhang',
+    )
+
+# building codes of the exam rooms
+BUILDINGS = ('BA', 'BN', 'EX', 'GB', 'MP', 'MS', 'SF', 'SS', 'UC', 'WB')
+
+# exam start and end times, three hours each, on the half hour from 8:00
+# to 19:30
+SESSIONS = tuple(
+    ('%d:%02d' % divmod(start, 60), '%d:%02d' % divmod(start + 180, 60))
+    for start in range(8 * 60, 20 * 60, 30))
+
+FIRST_DAY = date(2013, 12, 5)
+
+# days of the exam period, so the dates stay within one term however many
+# rows there are
+EXAM_DAYS = 21
+
+# sections sharing a date and start time, when the term has room for them
+SLOT_SIZE = 100
+
+# sections a course has at most
+MAX_SECTIONS = 4
+
+
+def department(n):
+    '''Return the n-th three letter department code.'''
+
+    letters = []
+    for _ in range(3):
+        n, letter = divmod(n, 26)
+        letters.append(chr(ord('A') + letter))
+    return ''.join(reversed(letters))
+
+
+def course_codes(rng):
+    '''Yield distinct course codes such as CSC108H1F, 900 per
+    department.'''
+
+    for number in xrange(26 ** 3 * 900):
+        dept, level = divmod(number, 900)
+        yield '%s%03d%s' % (
+            department(dept), 100 + level, rng.choice(('H1F', 'H1S', 'Y1Y')))
+
+
+def exam_date(day):
+    '''Return the day-th exam day as it is written in time.csv.'''
+
+    day = FIRST_DAY + timedelta(days=day)
+    return '%d-%s' % (day.day, day.strftime('%b-%y'))
+
+
+def exam_slots(rows):
+    '''Return the exam dates and the (start, end) sessions of each day
+    for rows sections: at least 10 days of three sessions, then more days
+    up to EXAM_DAYS, then more sessions a day, about SLOT_SIZE sections
+    to a slot until every session is used.'''
+
+    slots = rows // SLOT_SIZE
+    days = min(EXAM_DAYS, max(10, slots // 3))
+    per_day = min(len(SESSIONS), max(3, slots // days))
+    return ([exam_date(day) for day in range(days)],
+            [SESSIONS[i * len(SESSIONS) // per_day] for i in range(per_day)])
+
+
+def write_catalog(directory, rows, seed=0):
+    '''Write courses.csv, locations.csv and time.csv with rows sections
+    into directory and return their paths by table name. The same rows
+    and seed always give the same files.
+
+    courses.csv has CRLF line endings and quotes the names of sections
+    with several instructors; time.csv has a header and CR line endings
+    only, like the files the registrar sends.'''
+
+    rng = random.Random(seed)
+    dates, sessions = exam_slots(rows)
+    paths = dict(
+        (table, os.path.join(directory, name)) for table, name in (
+            ('Courses', 'courses.csv'), ('Locations', 'locations.csv'),
+            ('Time', 'time.csv')))
+
+    course_file = open(paths['Courses'], 'wb')
+    location_file = open(paths['Locations'], 'wb')
+    time_file = open(paths['Time'], 'wb')
+    courses = csv.writer(course_file)
+    locations = csv.writer(location_file)
+    times = csv.writer(time_file, lineterminator='\r')
+    times.writerow(['ID', 'Date', 'Start', 'End', 'Duration'])
+
+    codes = course_codes(rng)
+    row_id = 0
+    while row_id < rows:
+        course = next(codes)
+        sections = min(rng.randint(1, MAX_SECTIONS), rows - row_id)
+        for sec in range(sections):
+            row_id += 1
+            names = rng.sample(INSTRUCTORS, rng.choice((1, 1, 1, 2, 2, 3)))
+            courses.writerow(
+                [row_id, course, 'L%04d' % (101 + sec), ', '.join(names)])
+            locations.writerow([row_id, '%s %d' % (
+                rng.choice(BUILDINGS), rng.randint(100, 3199))])
+            start, end = rng.choice(sessions)
+            times.writerow(
+                [row_id, rng.choice(dates), start, end, 3])
+
+    course_file.close()
+    location_file.close()
+    time_file.close()
+    return paths
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Write synthetic courses, locations and time files")
+    parser.add_argument("rows", type=int, help="number of sections")
+    parser.add_argument("--dir", default=".", help="where to write them")
+    parser.add_argument("--seed", type=int, default=0)
+    options = parser.parse_args()
+    for table, path in sorted(
+            write_catalog(options.dir, options.rows, options.seed).items()):
+        print "%s: %s" % (table, path)